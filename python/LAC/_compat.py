@@ -29,6 +29,7 @@ default_encoding = sys.getfilesystemencoding()
 if PY2:
     text_type = unicode
     string_types = (str, unicode)
+    unichr = unichr
 
     def iterkeys(d): return d.iterkeys()
 
@@ -40,6 +41,7 @@ else:
     text_type = str
     string_types = (str,)
     xrange = range
+    unichr = chr
 
     def iterkeys(d): return iter(d.keys())
 
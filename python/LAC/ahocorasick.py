@@ -18,9 +18,19 @@
 
 """
 本模块实现AC自动机封装为Ahocorasick类，用于进行词典的多模匹配。
+DictAhocorasick以dict保存每个节点的goto表，用于内存中构建和修改的词典；
+ArrayAhocorasick将AC自动机的goto/fail/output表保存在连续数组中，用于保存为二进制词典及mmap装载。
 """
 
+import array
 import logging
+from bisect import bisect_left
+from collections import deque
+
+try:
+    from .prefix_tree import ArrayTrie
+except:
+    from prefix_tree import ArrayTrie
 
 
 class Node(object):
@@ -61,7 +71,7 @@ class Ahocorasick(object):
     def make(self):
         """构建fail指针路径"""
 
-        queue = list()
+        queue = deque()
         for key in self.__root.next:
             self.__root.next[key].fail = self.__root
             queue.append(self.__root.next[key])
@@ -69,7 +79,7 @@ class Ahocorasick(object):
         # 广度优先算法遍历设置fail指针
         while len(queue) > 0:
             # 基于当前节点的fail指针设置其子结点的fail指针
-            current = queue.pop(0)
+            current = queue.popleft()
 
             for k in current.next:
                 current_fail = current.fail
@@ -154,6 +164,285 @@ class Ahocorasick(object):
         return result
 
 
+class MatchFilter(object):
+    """由iter_matches产出的匹配得到search及search_all的结果，子类实现iter_matches"""
+
+    def iter_matches(self, content):
+        """按结束位置顺序产出所有匹配(start, end)，同一结束位置的匹配按长度从长到短"""
+        raise NotImplementedError
+
+    def search(self, content):
+        """前向最大匹配.
+
+        与prefix_tree.TriedTree.search的结果一致：按起始位置从前向后，同一起始位置按
+        结束位置从短到长，保留结束位置大于已保留结果的匹配.
+
+        Args:
+            content: string类型, 用于多模匹配的字符串
+
+        Returns:
+            list类型, 最大匹配单词列表，每个元素为匹配的模式串在句中的起止位置，比如：
+            [(0, 2), [4, 7]]
+
+        """
+        # 按起始位置分桶，同一起始位置的结束位置天然递增
+        buckets = [None] * len(content)
+        for start, end in self.iter_matches(content):
+            if buckets[start] is None:
+                buckets[start] = [end]
+            else:
+                buckets[start].append(end)
+
+        result = []
+        last_end = 0
+        for start, ends in enumerate(buckets):
+            if ends is None:
+                continue
+            for end in ends:
+                if end > last_end:
+                    result.append((start, end))
+                    last_end = end
+
+        return result
+
+    def search_all(self, content):
+        """多模匹配的完全匹配.
+
+        Args:
+            content: string类型, 用于多模匹配的字符串
+
+        Returns:
+            list类型, 按(起始位置, 结束位置)排序的所有匹配单词列表，不包含结束位置，比如：
+            [(0, 2), [4, 7]]
+
+        """
+        return sorted(self.iter_matches(content))
+
+
+class DictAhocorasick(MatchFilter):
+    """goto表为dict的AC自动机
+
+    每个节点的goto表为字符到子节点编号的dict，转移为一次dict查询，构建和匹配都比
+    ArrayAhocorasick的二分查找快，用于内存中的词典，保存二进制词典时使用ArrayAhocorasick。
+    search只需要goto表，fail表和output表在第一次调用iter_matches或search_all时构建
+
+    Attributes:
+        goto: list类型，每个节点的goto表，根节点为0
+        value: list类型，每个节点对应单词的长度，非单词节点为0
+        links: (fail, output)，尚未构建时为None，fail为每个节点的fail指针，
+               output为每个节点沿fail链的第一个单词节点(不含自身)，不存在时为0
+    """
+
+    def __init__(self, goto, value):
+        self.goto = goto
+        self.value = value
+        self.links = None
+
+    @classmethod
+    def build(cls, words):
+        """由单词列表构建AC自动机的goto表"""
+        goto, value = [{}], [0]
+        for word in words:
+            state = 0
+            for char in word:
+                row = goto[state]
+                state = row.get(char)
+                if state is None:
+                    state = row[char] = len(goto)
+                    goto.append({})
+                    value.append(0)
+            if state:
+                value[state] = len(word)
+        return cls(goto, value)
+
+    def __len__(self):
+        """节点数"""
+        return len(self.goto)
+
+    def _build_links(self):
+        """广度优先遍历构建fail表和output表，父节点的fail指针总是先于子节点确定"""
+        goto, value = self.goto, self.value
+        fail = [0] * len(goto)
+        output = [0] * len(goto)
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                target = fail[state]
+                while True:
+                    next_state = goto[target].get(char)
+                    if next_state is not None:
+                        target = next_state
+                        break
+                    if target == 0:
+                        break
+                    target = fail[target]
+
+                fail[child] = target
+                output[child] = target if value[target] else output[target]
+
+        # 并发构建的结果相同，整体赋值即可
+        self.links = (fail, output)
+        return self.links
+
+    def iter_matches(self, content):
+        """按结束位置顺序产出所有匹配，同一结束位置的匹配按长度从长到短
+
+        Args:
+            content: string类型, 用于多模匹配的字符串
+
+        Returns:
+            生成器，每个元素为匹配的模式串在句中的起止位置(start, end)，不包含end
+        """
+        goto, value = self.goto, self.value
+        fail, output = self.links or self._build_links()
+
+        state = 0
+        for position, char in enumerate(content):
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+
+            node = state if value[state] else output[state]
+            while node:
+                yield position + 1 - value[node], position + 1
+                node = output[node]
+
+    def search(self, content):
+        """前向最大匹配.
+
+        与prefix_tree.TriedTree.search的结果一致。从每个起始位置沿goto表向后匹配，
+        不需要fail表，也不需要按起始位置对所有匹配分桶.
+
+        Args:
+            content: string类型, 用于多模匹配的字符串
+
+        Returns:
+            list类型, 最大匹配单词列表，每个元素为匹配的模式串在句中的起止位置，比如：
+            [(0, 2), [4, 7]]
+
+        """
+        goto, value = self.goto, self.value
+        root = goto[0]
+        length = len(content)
+
+        result = []
+        last_end = 0
+        for start in range(length):
+            state = root.get(content[start])
+            end = start + 1
+            while state is not None:
+                if value[state] and end > last_end:
+                    result.append((start, end))
+                    last_end = end
+                if end == length:
+                    break
+                state = goto[state].get(content[end])
+                end += 1
+
+        return result
+
+
+class ArrayAhocorasick(MatchFilter):
+    """基于连续数组的AC自动机
+
+    goto表为prefix_tree.ArrayTrie，节点按广度优先顺序编号，fail表和output表为与节点
+    一一对应的数组，匹配时不创建任何字符串切片，耗时与文本长度及匹配数成线性关系。
+
+    Attributes:
+        trie: ArrayTrie类型，goto表，value为单词长度，非单词节点为0
+        fail: array类型，每个节点的fail指针
+        output: array类型，每个节点沿fail链的第一个单词节点(不含自身)，不存在时为0
+    """
+
+    def __init__(self, trie, fail, output):
+        self.trie = trie
+        self.fail = fail
+        self.output = output
+
+    @classmethod
+    def build(cls, words):
+        """由单词列表构建AC自动机"""
+        trie = ArrayTrie.build((word, len(word)) for word in words if word)
+        first, label, value = trie.first, trie.label, trie.value
+
+        fail = array.array('i', [0]) * len(trie)
+        output = array.array('i', [0]) * len(trie)
+
+        # 广度优先遍历设置fail指针，父节点的fail指针总是先于子节点确定
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            for child in range(first[state], first[state + 1]):
+                queue.append(child)
+                if state == 0:
+                    continue
+
+                code = label[child]
+                target = fail[state]
+                while True:
+                    begin, end = first[target], first[target + 1]
+                    index = bisect_left(label, code, begin, end)
+                    if index < end and label[index] == code:
+                        target = index
+                        break
+                    if target == 0:
+                        break
+                    target = fail[target]
+
+                fail[child] = target
+                output[child] = target if value[target] else output[target]
+
+        return cls(trie, fail, output)
+
+    def __len__(self):
+        """节点数"""
+        return len(self.trie)
+
+    def to_arrays(self):
+        """返回用于prefix_tree.save_arrays保存的数组列表"""
+        return self.trie.to_arrays() + [('fail', self.fail), ('output', self.output)]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由prefix_tree.load_arrays装载的数组构建AC自动机"""
+        return cls(ArrayTrie.from_arrays(arrays), arrays['fail'], arrays['output'])
+
+    def iter_matches(self, content):
+        """按结束位置顺序产出所有匹配，同一结束位置的匹配按长度从长到短
+
+        Args:
+            content: string类型, 用于多模匹配的字符串
+
+        Returns:
+            生成器，每个元素为匹配的模式串在句中的起止位置(start, end)，不包含end
+        """
+        first, label, value = self.trie.first, self.trie.label, self.trie.value
+        fail, output = self.fail, self.output
+
+        state = 0
+        for position, char in enumerate(content):
+            code = ord(char)
+            while True:
+                begin, end = first[state], first[state + 1]
+                child = bisect_left(label, code, begin, end)
+                if child < end and label[child] == code:
+                    state = child
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+
+            node = state if value[state] else output[state]
+            while node:
+                yield position + 1 - value[node], position + 1
+                node = output[node]
+
+
 if __name__ == '__main__':
 
     ah = Ahocorasick()
@@ -167,3 +456,11 @@ if __name__ == '__main__':
 
     for begin, end in ah.search(string):
         print('search:', string[begin:end + 1])
+
+    ah = DictAhocorasick.build(x)
+    for begin, end in ah.search(string):
+        print('dict search:', string[begin:end])
+
+    ah = ArrayAhocorasick.build(x)
+    for begin, end in ah.search(string):
+        print('array search:', string[begin:end])
@@ -0,0 +1,169 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现基于asyncio的预测接口，将并发的单条请求合并为batch预测，仅支持Python3。
+
+使用示例：
+    lac = AsyncLAC(LAC(mode='lac'), max_batch_size=64, max_wait=0.005, workers=2)
+    words, tags = await lac.tag(u'百度是一家高科技公司')
+"""
+
+import sys
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import parallel
+
+__all__ = [
+    'AsyncLAC',
+]
+
+
+class AsyncLAC(object):
+    """LAC的asyncio封装
+
+    并发调用tag的请求先进入等待队列，凑满max_batch_size条或最早的请求等待超过
+    max_wait秒时合并为一个batch，在工作线程(或进程)中预测，event loop不被阻塞。
+
+    Attributes:
+        lac: 被封装的LAC对象
+        max_batch_size: 每个batch的最大文本数
+        max_wait: 请求在队列中的最长等待时间(秒)
+        workers: 并行预测的batch数
+    """
+
+    def __init__(self, lac, max_batch_size=64, max_wait=0.005, workers=1, use_process=False):
+        """
+        Args:
+            lac: LAC对象
+            max_batch_size: 每个batch的最大文本数
+            max_wait: 请求在队列中的最长等待时间(秒)，越大batch越满，单条请求的延迟越高
+            workers: 工作线程或进程数，线程模式下每个线程使用一个lac.clone()，
+                     clone与lac共享模型参数和用户词典，lac本身不被工作线程使用
+            use_process: 为True时在工作进程中预测，每个进程装载一次模型，需要Python3.7以上；
+                         工作进程使用创建时的用户词典，之后的修改和热更新不会生效
+        """
+        self.lac = lac
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+
+        if use_process:
+            # ProcessPoolExecutor的initializer参数需要Python3.7
+            if sys.version_info < (3, 7):
+                raise RuntimeError("AsyncLAC with use_process=True requires Python 3.7 or later")
+            model = lac.model
+            self._executor = ProcessPoolExecutor(
+                workers, initializer=parallel._init_worker,
+                initargs=(model.model_path, model.mode, model.args.use_cuda,
+                          model.max_batch_tokens, model.custom, model.backend,
+                          model.fast_path))
+            self._run_batch = parallel._run_chunk
+        else:
+            # predictor不能被多个线程同时使用，每个工作线程取一个空闲的clone，
+            # 调用方的lac不放入其中，仍可以在其他线程中使用
+            self._executor = ThreadPoolExecutor(workers)
+            self._idle = queue.Queue()
+            for _ in range(workers):
+                self._idle.put(lac.clone())
+            self._run_batch = self._run_thread
+
+        self._pending = []
+        self._timer = None
+        self._inflight = set()
+
+    def _run_thread(self, texts):
+        """在工作线程中预测一个batch"""
+        lac = self._idle.get()
+        try:
+            return lac.run(texts)
+        finally:
+            self._idle.put(lac)
+
+    async def tag(self, text):
+        """预测一条文本，返回与LAC.run(text)相同的结果"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def tag_batch(self, texts):
+        """预测多条文本，各条文本与其它请求一同合并为batch"""
+        return await asyncio.gather(*[self.tag(text) for text in texts])
+
+    def _flush(self):
+        """将等待队列中的请求按max_batch_size切分为batch并提交预测"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        loop = asyncio.get_event_loop()
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+
+            # 已被取消的请求不再预测
+            batch = [(text, future) for text, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            task = loop.run_in_executor(self._executor, self._run_batch,
+                                        [text for text, future in batch])
+            self._inflight.add(task)
+            task.add_done_callback(
+                lambda task, batch=batch: self._resolve(task, batch))
+
+    def _resolve(self, task, batch):
+        """将batch的预测结果分发给各请求"""
+        self._inflight.discard(task)
+        if task.cancelled():
+            for text, future in batch:
+                future.cancel()
+            return
+
+        error = task.exception()
+        results = [None] * len(batch) if error is not None else task.result()
+
+        for (text, future), result in zip(batch, results):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """预测完所有已提交的请求，关闭工作线程或进程"""
+        if self._pending:
+            self._flush()
+        if self._inflight:
+            await asyncio.wait(list(self._inflight))
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
@@ -0,0 +1,315 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现Python预测流程的性能测试，分阶段统计耗时并输出JSON格式的报告。
+
+每个配置(模型、语料、batch大小)在单独的子进程中装载模型并测试，报告中的峰值内存
+只包含该配置自身的开销。
+
+使用示例：
+    python -m LAC.benchmark --modes seg lac rank --batch-sizes 1 32 --lengths 16 256
+    python -m LAC.benchmark --modes lac --input corpus.txt --output report.json
+    python -m LAC.benchmark --modes seg lac --backend numpy
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import sys
+import json
+import random
+import logging
+import argparse
+import platform
+import multiprocessing
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from ._compat import strdecode
+from .metrics import timer
+
+__all__ = [
+    'main',
+    'benchmark',
+]
+
+# 每个配置至少统计的延迟样本数，语料的batch数不足时重复测试整个语料
+MIN_LATENCY_SAMPLES = 100
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存(MB)，不支持的平台返回None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS单位为字节，Linux单位为KB
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def synthetic_corpus(dataset, num_texts, text_length, seed=1):
+    """使用模型词表中的单字随机生成指定长度的文本"""
+    chars = [word for word in dataset.id2word
+             if word is not None and len(word) == 1]
+    rand = random.Random(seed)
+    return [u''.join(rand.choice(chars) for _ in range(text_length))
+            for _ in range(num_texts)]
+
+
+def file_corpus(filename, num_texts=None):
+    """读取文件的每一行作为一条文本，跳过空行"""
+    texts = []
+    with io.open(filename, 'r', encoding='utf8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                texts.append(strdecode(line))
+            if num_texts and len(texts) >= num_texts:
+                break
+    return texts
+
+
+def _timed(timings, stage, func, *args):
+    """执行func并将耗时累计到timings[stage]"""
+    start = timer()
+    result = func(*args)
+    timings[stage] = timings.get(stage, 0.0) + timer() - start
+    return result
+
+
+def run_stages(lac, texts, timings):
+    """按阶段执行一个batch的预测流程，并记录每个阶段的耗时
+    Args:
+        lac: LAC对象
+        texts: 由非空string组成的list
+        timings: dict类型，阶段名到累计耗时(秒)的映射
+    """
+    model = lac.model
+    lac_model = model.lac if model.mode == 'rank' else model
+    dataset = lac_model.dataset
+
+    if model.mode == 'seg':
+        ids, lod = _timed(timings, 'text_to_ids', dataset.encode_texts, texts)
+        words_length = None
+    else:
+        segments = _timed(timings, 'fast_cut',
+                          lac_model.segment_tool.fast_cut_batch, texts)
+        ids, words_length, lod = _timed(timings, 'text_to_ids',
+                                        dataset.encode_segments, segments)
+
+    tensor = _timed(timings, 'to_tensor', lac_model.to_tensor, ids, lod)
+    crf_decode = _timed(timings, 'predictor.run', lac_model.predictor.run, [tensor])
+
+    # 用户词典单独计时
+    custom, lac_model.custom = model.custom, None
+    try:
+        result = _timed(timings, 'parse_result', lac_model.parse_result,
+                        texts, crf_decode[0], dataset, words_length)
+    finally:
+        lac_model.custom = custom
+
+    if custom:
+        char_tags = []
+        for words, tags, word_starts in result:
+            char_tags.append([tag + '-B' if index == 0 else tag + '-I'
+                              for word, tag in zip(words, tags)
+                              for index in range(len(word))])
+        _timed(timings, 'customization',
+               lambda: [custom.parse_customization(text, tags)
+                        for text, tags in zip(texts, char_tags)])
+
+    if model.mode == 'rank':
+        word_starts = [starts for words, tags, starts in result]
+        rank_decode = _timed(timings, 'rank_predictor.run', model.predictor.run,
+                             [tensor, crf_decode[0]])
+        _timed(timings, 'rank_parse_result', model.parse_result,
+               word_starts, rank_decode[0], words_length)
+
+
+def benchmark(lac, texts, batch_size, corpus='synthetic', text_length=None,
+              min_samples=MIN_LATENCY_SAMPLES):
+    """对一组文本执行性能测试
+    Args:
+        lac: LAC对象
+        texts: 由非空string组成的list
+        batch_size: 每次预测的文本数
+        corpus: 语料名称，写入报告
+        text_length: 合成语料的文本长度，写入报告
+        min_samples: 延迟样本数的下限，语料的batch数不足时重复测试整个语料
+    Returns:
+        dict类型，该配置下的测试报告，peak_rss_mb为当前进程的峰值内存
+    """
+    if not texts:
+        raise ValueError("the corpus %s is empty" % corpus)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    num_chars = sum(len(text) for text in texts)
+
+    # 预热
+    lac.run(batches[0])
+
+    # 每次run单独计时，整个语料为一轮
+    latency = []
+    rounds = 0
+    while rounds == 0 or len(latency) < min_samples:
+        for batch in batches:
+            start = timer()
+            lac.run(batch)
+            latency.append(timer() - start)
+        rounds += 1
+
+    timings = {}
+    for batch in batches:
+        run_stages(lac, batch, timings)
+    stage_total = sum(timings.values())
+
+    total = sum(latency)
+    return {
+        "mode": lac.model.mode,
+        "backend": lac.model.backend,
+        "corpus": corpus,
+        "text_length": text_length,
+        "batch_size": batch_size,
+        "num_texts": len(texts),
+        "num_chars": num_chars,
+        "rounds": rounds,
+        "chars_per_sec": num_chars * rounds / total if total else None,
+        "texts_per_sec": len(texts) * rounds / total if total else None,
+        "latency_ms": {
+            "samples": len(latency),
+            "mean": float(np.mean(latency) * 1000),
+            "p50": float(np.percentile(latency, 50) * 1000),
+            "p99": float(np.percentile(latency, 99) * 1000),
+        },
+        "stages": dict((stage, {"total_ms": seconds * 1000,
+                                "share": seconds / stage_total if stage_total else None})
+                       for stage, seconds in timings.items()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _benchmark_config(config):
+    """在子进程中装载模型并测试一个配置，语料为空时返回None
+    Args:
+        config: dict类型，包含mode、backend、use_cuda、custom、corpus、text_length、
+                texts(文件语料，合成语料为None)、num_texts、seed、batch_size、min_samples
+    """
+    from LAC import LAC
+
+    lac = LAC(mode=config['mode'], use_cuda=config['use_cuda'], backend=config['backend'])
+    if config['custom']:
+        lac.load_customization(config['custom'])
+
+    texts = config['texts']
+    if texts is None:
+        model = lac.model
+        dataset = model.lac.dataset if model.mode == 'rank' else model.dataset
+        texts = synthetic_corpus(dataset, config['num_texts'], config['text_length'],
+                                 config['seed'])
+    if not texts:
+        return None
+    return benchmark(lac, texts, config['batch_size'], config['corpus'],
+                     config['text_length'], config['min_samples'])
+
+
+def _run_isolated(func, arg):
+    """在新的子进程中执行func(arg)，子进程的峰值内存不受父进程及其他配置的影响"""
+    if hasattr(multiprocessing, 'get_context'):
+        pool = multiprocessing.get_context('spawn').Pool(1)
+    else:
+        # Python2只支持fork，父进程不装载模型，子进程继承的内存很小
+        pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(func, (arg,))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    """命令行入口，输出JSON格式的测试报告"""
+    from LAC import version
+
+    parser = argparse.ArgumentParser(description='LAC Python inference benchmark')
+    parser.add_argument('--modes', nargs='+', default=['seg', 'lac', 'rank'],
+                        choices=['seg', 'lac', 'rank'], help='models to benchmark')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 32, 128],
+                        help='number of texts per run call')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[16, 128, 1024],
+                        help='text lengths of the synthetic corpus')
+    parser.add_argument('--num-texts', type=int, default=256,
+                        help='number of texts per corpus')
+    parser.add_argument('--min-samples', type=int, default=MIN_LATENCY_SAMPLES,
+                        help='minimum number of timed run calls per configuration, '
+                             'the corpus is repeated when it has fewer batches')
+    parser.add_argument('--input', default=None,
+                        help='benchmark lines of this file besides the synthetic corpus')
+    parser.add_argument('--custom', default=None,
+                        help='customization dict to load before benchmarking')
+    parser.add_argument('--backend', default='paddle', choices=['paddle', 'numpy'],
+                        help='inference backend, numpy runs lac and seg models without paddle')
+    parser.add_argument('--use-cuda', action='store_true', help='run models on GPU')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the synthetic corpus')
+    parser.add_argument('--output', default=None,
+                        help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.backend == 'numpy' and 'rank' in args.modes:
+        parser.error("the rank model only supports the paddle backend")
+
+    corpora = [('synthetic', length, None) for length in args.lengths]
+    if args.input:
+        corpora.append((args.input, None, file_corpus(args.input, args.num_texts)))
+
+    results = []
+    for mode in args.modes:
+        for corpus, length, texts in corpora:
+            for batch_size in args.batch_sizes:
+                result = _run_isolated(_benchmark_config, {
+                    'mode': mode, 'backend': args.backend, 'use_cuda': args.use_cuda,
+                    'custom': args.custom, 'corpus': corpus, 'text_length': length,
+                    'texts': texts, 'num_texts': args.num_texts, 'seed': args.seed,
+                    'batch_size': batch_size, 'min_samples': args.min_samples})
+                if result is None:
+                    logging.warning("Skipped the empty corpus %s" % corpus)
+                    break
+                results.append(result)
+
+    report = {
+        "lac_version": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with io.open(args.output, 'w', encoding='utf8') as f:
+            f.write(strdecode(output))
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现预测结果的缓存，用于重复请求较多的场景。
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """线程安全的LRU缓存
+
+    Attributes:
+        capacity: 缓存的最大条目数
+        hits: 命中次数
+        misses: 未命中次数
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """查询缓存，命中时将该条目移至最近使用的位置"""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """清空缓存，命中统计保留"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """返回缓存的统计信息"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._data), "capacity": self.capacity}
+
+    def __len__(self):
+        return len(self._data)
@@ -24,48 +24,98 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
+import sys
+import json
 import argparse
 parser = argparse.ArgumentParser(description='LAC Init Argments')
 parser.add_argument('--segonly', action='store_true', 
                     help='run segment only if setting')
 parser.add_argument('--rank', action='store_true', 
                     help='run rank model if setting')
-args = parser.parse_args()
+parser.add_argument('--batch-size', type=int, default=64,
+                    help='number of lines per model call, 1 for interactive input')
+parser.add_argument('--workers', type=int, default=1,
+                    help='run the model in this many processes if greater than 1, '
+                         'ignored for interactive input')
+parser.add_argument('--input', default=None,
+                    help='read lines from this file instead of stdin')
+parser.add_argument('--output', default=None,
+                    help='write results to this file instead of stdout')
+parser.add_argument('--format', default='plain', choices=['plain', 'json', 'tsv'],
+                    help='output format: word/tag pairs, one json object or '
+                         'tab separated words and tags per line')
+parser.add_argument('--backend', default='paddle', choices=['paddle', 'numpy'],
+                    help='inference backend, numpy runs lac and seg models without paddle')
 
 __all__ = [
     'main',
 ]
 
 
-def main(args=args):
+def format_result(result, mode, fmt):
+    """将一条预测结果格式化为一行输出"""
+    if mode == 'seg':
+        words, columns = result, []
+    elif mode == 'rank':
+        words, columns = result[0], [result[1], result[2]]
+    else:
+        words, columns = result[0], [result[1]]
+
+    if fmt == 'json':
+        keys = ['words', 'tags', 'rank'][:len(columns) + 1]
+        return u"%s" % json.dumps(dict(zip(keys, [words] + columns)), ensure_ascii=False)
+    if fmt == 'tsv':
+        return u"\t".join(u" ".join(u"%s" % item for item in column)
+                          for column in [words] + columns)
+
+    if mode == 'seg':
+        return u" ".join(words)
+    # rank模型输出词语重要性，lac模型输出词性
+    return u" ".join(u"%s/%s" % (word, label)
+                     for word, label in zip(words, columns[-1]))
+
+
+def main(args=None):
     """主程序入口"""
     from LAC import LAC
     from LAC._compat import strdecode
-    import sys
+    from LAC.reader import batch_iter
 
-    if args.segonly:
-        lac = LAC(mode='seg')
-    elif args.rank:
-        lac = LAC(mode='rank')
-    else:
-        lac = LAC()
-
-
-    while True:
-        line = sys.stdin.readline()
-        if not line:
-            break
-
-        line = strdecode(line.strip())
-        if args.segonly:
-            print(u" ".join(lac.run(line)))
-        elif args.rank:
-            words, tags, words_rank = lac.run(line)
-            print(u" ".join(u"%s/%s" % (word, rank)
-                            for word, tag, rank in zip(words, tags, words_rank)))
-        else :
-            words, tags = lac.run(line)
-            print(u" ".join(u"%s/%s" % (word, tag)
-                            for word, tag in zip(words, tags)))
-
-    return 0
\ No newline at end of file
+    # 在入口中解析参数，import本模块时不读取sys.argv
+    if args is None:
+        args = parser.parse_args()
+
+    mode = 'seg' if args.segonly else 'rank' if args.rank else 'lac'
+    # 交互式输入时逐行预测并立即输出，不使用多进程
+    interactive = not args.input and sys.stdin.isatty()
+    batch_size = 1 if interactive else max(args.batch_size, 1)
+    workers = 1 if interactive else args.workers
+
+    # 多进程时模型在工作进程中装载，主进程不创建predictor
+    lac = LAC(mode=mode, lazy=workers > 1, backend=args.backend)
+
+    fin = io.open(args.input if args.input else sys.stdin.fileno(), 'rb',
+                  closefd=bool(args.input))
+    fout = io.open(args.output if args.output else sys.stdout.fileno(), 'w',
+                   encoding='utf8', closefd=bool(args.output))
+
+    try:
+        # 解码后再strip，以去除全角空格等Unicode空白
+        lines = (strdecode(line).strip() for line in fin)
+        if workers > 1:
+            results = batch_iter(lac.run_parallel(lines, workers=workers,
+                                                  chunk_size=batch_size), batch_size)
+        else:
+            results = (lac.run(batch) for batch in batch_iter(lines, batch_size))
+
+        for batch in results:
+            fout.write(u"".join(format_result(result, mode, args.format) + u"\n"
+                                for result in batch))
+            if interactive:
+                fout.flush()
+    finally:
+        fin.close()
+        fout.close()
+
+    return 0
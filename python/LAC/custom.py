@@ -21,14 +21,108 @@
 """
 
 from io import open
+import array
 import logging
+import threading
 
 try:
-    from ._compat import strdecode
-    from .prefix_tree import TriedTree
+    from ._compat import strdecode, unichr
+    from .ahocorasick import ArrayAhocorasick, DictAhocorasick
+    from .prefix_tree import save_arrays, load_arrays
 except:
-    from _compat import strdecode
-    from prefix_tree import TriedTree
+    from _compat import strdecode, unichr
+    from ahocorasick import ArrayAhocorasick, DictAhocorasick
+    from prefix_tree import save_arrays, load_arrays
+
+CUSTOM_DICT_MAGIC = b'LACCUST'
+CUSTOM_DICT_VERSION = 1
+
+
+def is_compiled(filename):
+    """判断文件是否为Customization.compile生成的二进制词典"""
+    with open(filename, 'rb') as f:
+        return f.read(8) == CUSTOM_DICT_MAGIC.ljust(8, b'\0')
+
+
+def split_entry(line, sep=None):
+    """解析一条人工干预词典，如"花/n 开/v"
+    Args:
+        line: Unicode编码的字符串
+        sep: 表示短语片段的分隔符，默认为空格' '或制表符'\t'
+    Returns:
+        (phrase, tags, offsets)，分别为拼接后的短语、每个片段的标签(未标注时为空字符串)、
+        每个片段在短语中的结束位置，line为空时返回None
+    """
+    if sep is None:
+        words = line.strip().split()
+    else:
+        words = line.strip().split(strdecode(sep))
+
+    if len(words) == 0:
+        return None
+
+    phrase = ""
+    tags = []
+    offset = []
+    for word in words:
+        if word.rfind('/') < 1:
+            phrase += word
+            tags.append('')
+        else:
+            phrase += word[:word.rfind('/')]
+            tags.append(word[word.rfind('/') + 1:])
+        offset.append(len(phrase))
+    return phrase, tags, offset
+
+
+class CompiledDictItems(object):
+    """
+    二进制词典中短语到(tags, offsets)的只读映射
+    数据保存在mmap的数组中，查询时经AC自动机的goto表定位短语对应的节点
+    Attributes:
+        ac: ArrayAhocorasick类型，与词典一同装载的AC自动机
+        node_item: 每个节点对应的短语编号，非短语节点为-1
+        item_first: 每个短语的片段在seg_offset/seg_tag中的起始位置，长度为短语数 + 1
+        seg_offset: 每个片段在短语中的结束位置
+        seg_tag: 每个片段的标签在tag_names中的编号
+        tag_names: 标签名列表
+    """
+
+    def __init__(self, ac, node_item, item_first, seg_offset, seg_tag, tag_names):
+        self.ac = ac
+        self.node_item = node_item
+        self.item_first = item_first
+        self.seg_offset = seg_offset
+        self.seg_tag = seg_tag
+        self.tag_names = tag_names
+
+    def __getitem__(self, phrase):
+        node = self.ac.trie.find(phrase)
+        item = self.node_item[node] if node != -1 else -1
+        if item == -1:
+            raise KeyError(phrase)
+
+        begin, end = self.item_first[item], self.item_first[item + 1]
+        return ([self.tag_names[tag] for tag in self.seg_tag[begin:end]],
+                list(self.seg_offset[begin:end]))
+
+    def __contains__(self, phrase):
+        node = self.ac.trie.find(phrase)
+        return node != -1 and self.node_item[node] != -1
+
+    def __len__(self):
+        return len(self.item_first) - 1
+
+    def __iter__(self):
+        """深度优先遍历goto表，产出所有短语"""
+        first, label = self.ac.trie.first, self.ac.trie.label
+        stack = [(0, u'')]
+        while stack:
+            state, prefix = stack.pop()
+            if self.node_item[state] != -1:
+                yield prefix
+            for child in range(first[state], first[state + 1]):
+                stack.append((child, prefix + unichr(label[child])))
 
 
 class Customization(object):
@@ -37,89 +131,245 @@ class Customization(object):
     """
 
     def __init__(self):
-        self.dictitem = {}
-        self.ac = None
-        pass
-    
-    def add_word(self, words, sep=None):
-        """装载人工干预词典（单词输入）"""
-        if self.ac is None:
-            self.ac = TriedTree()
-        words = strdecode(words)
-        if sep == None:
-            words = words.strip().split()
+        """
+        Args:
+            self._snapshot: (dictitem, ac)，dictitem为短语到(tags, offsets)的映射，
+                            ac为由dictitem中的短语构建的AC自动机(内存中的词典为DictAhocorasick，
+                            二进制词典为ArrayAhocorasick)，未装载词典时为None。
+                            修改词典时在锁内构建新的snapshot并整体替换，匹配时只读取一次
+            self._pending: add_word添加、尚未合并进snapshot的短语，下一次读取snapshot时
+                           一并重新构建AC自动机，逐个添加单词时不必每次重新构建
+            self.compiled_path: 由load_compiled装载时为二进制词典路径
+        """
+        self._snapshot = ({}, None)
+        self._pending = {}
+        self.compiled_path = None
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        """当前的(dictitem, ac)，有未合并的add_word时先重新构建AC自动机"""
+        if self._pending:
+            with self._lock:
+                # 双重检查，并发的读取只有一个执行构建
+                if self._pending:
+                    self._rebuild(lambda dictitem: None)
+        return self._snapshot
+
+    @property
+    def dictitem(self):
+        """当前词典中短语到(tags, offsets)的映射，只读"""
+        return self.snapshot[0]
+
+    @property
+    def ac(self):
+        """当前词典的AC自动机"""
+        return self.snapshot[1]
+
+    def __getstate__(self):
+        """由二进制词典装载的对象只序列化路径，反序列化时重新mmap装载，多进程间共享内存页"""
+        dictitem, ac = self.snapshot
+        if self.compiled_path is not None:
+            return {'compiled_path': self.compiled_path}
+        return {'dictitem': dictitem, 'ac': ac}
+
+    def __setstate__(self, state):
+        self.__init__()
+        if 'compiled_path' in state:
+            self.load_compiled(state['compiled_path'])
         else:
-            sep = strdecode(sep)
-            words = words.strip().split(sep)
+            self._snapshot = (state['dictitem'], state['ac'])
 
-        if len(words) == 0:
-            return
+    def _update(self, edit):
+        """修改词典并重新构建AC自动机，并发的修改不会丢失，匹配中的请求继续使用旧的snapshot
+        Args:
+            edit: 以可修改的dict为参数的函数，返回值作为_update的返回值，
+                  返回False时表示词典未变化，不重新构建
+        """
+        with self._lock:
+            return self._rebuild(edit)
 
-        phrase = ""
-        tags = []
-        offset = []
-        for word in words:
-            if word.rfind('/') < 1:
-                phrase += word
-                tags.append('')
+    def _rebuild(self, edit):
+        """需持有_lock，复制当前词典并合并未合并的add_word，调用edit(dictitem)原地修改副本后
+        构建AC自动机，再整体替换snapshot
+        """
+        current = self._snapshot[0]
+        if isinstance(current, dict):
+            dictitem = dict(current)
+        else:
+            # 二进制词典只读，修改前转为dict
+            dictitem = dict((phrase, current[phrase]) for phrase in current)
+        changed = bool(self._pending)
+        dictitem.update(self._pending)
+        result = edit(dictitem)
+        if changed or result is not False:
+            self._snapshot = (dictitem, DictAhocorasick.build(dictitem))
+            self._pending = {}
+            self.compiled_path = None
+        return result
+
+    @staticmethod
+    def _parse_entries(entries, sep=None):
+        """将词典条目解析为(phrase, (tags, offsets))的list"""
+        items = []
+        for entry in entries:
+            if isinstance(entry, tuple):
+                phrase, tags, offset = entry
+                phrase = strdecode(phrase)
+                if len(tags) == 0 or len(tags) != len(offset) or offset[-1] != len(phrase):
+                    raise ValueError("invalid customization entry: %r" % (entry,))
+                tags, offset = list(tags), list(offset)
             else:
-                phrase += word[:word.rfind('/')]
-                tags.append(word[word.rfind('/') + 1:])
-            offset.append(len(phrase))
+                entry = split_entry(strdecode(entry), sep)
+                if entry is None:
+                    continue
+                phrase, tags, offset = entry
 
-        if len(phrase) < 2 and tags[0] == '':
-            return
+            if len(phrase) < 2 and tags[0] == '':
+                continue
+            items.append((phrase, (tags, offset)))
+        return items
+
+    def add_word(self, words, sep=None):
+        """装载人工干预词典（单词输入），AC自动机在下一次匹配前重新构建，
+        连续添加多个单词时只构建一次
+        """
+        items = self._parse_entries([words], sep)
+        with self._lock:
+            self._pending.update(items)
+            if items:
+                self.compiled_path = None
+
+    def add_words(self, entries, sep=None):
+        """批量装载人工干预词典，所有单词添加完成后立即重新构建一次AC自动机
+        Args:
+            entries: 可迭代对象，每个元素为与词典格式一致的字符串，如"花/n 开/v"，
+                     或已切分的(phrase, tags, offsets)，如(u"花开", ["n", "v"], [1, 2])
+            sep: 表示字符串中短语片段的分隔符，默认为空格' '或制表符'\t'
+        """
+        items = self._parse_entries(entries, sep)
+        self._update(lambda dictitem: dictitem.update(items))
+
+    def remove_word(self, words, sep=None):
+        """删除单词，格式与add_word一致，也可以是拼接后的短语
+        Returns:
+            单词是否存在
+        """
+        entry = split_entry(strdecode(words), sep)
+        if entry is None or entry[0] not in self.dictitem:
+            return False
+
+        def _remove(dictitem):
+            return dictitem.pop(entry[0], None) is not None
+        return self._update(_remove)
 
-        self.dictitem[phrase] = (tags, offset)
-        self.ac.add_word(phrase)
+    def clear(self):
+        """清空人工干预词典"""
+        with self._lock:
+            self._snapshot = ({}, DictAhocorasick.build({}))
+            self._pending = {}
+            self.compiled_path = None
 
     def load_customization(self, filename, sep=None):
-        """装载人工干预词典"""
-        self.ac = TriedTree()
+        """装载人工干预词典，替换当前词典"""
         with open(filename, 'r', encoding='utf8') as f:
-            for line in f:
-                if sep == None:
-                    words = line.strip().split()
-                else:
-                    sep = strdecode(sep)
-                    words = line.strip().split(sep)
-
-                if len(words) == 0:
-                    continue
+            dictitem = dict(self._parse_entries(f, sep))
+        ac = DictAhocorasick.build(dictitem)
+        with self._lock:
+            self._snapshot = (dictitem, ac)
+            self._pending = {}
+            self.compiled_path = None
 
-                phrase = ""
-                tags = []
-                offset = []
-                for word in words:
-                    if word.rfind('/') < 1:
-                        phrase += word
-                        tags.append('')
-                    else:
-                        phrase += word[:word.rfind('/')]
-                        tags.append(word[word.rfind('/') + 1:])
-                    offset.append(len(phrase))
+    @classmethod
+    def from_file(cls, filename, sep=None):
+        """装载文本词典或compile生成的二进制词典，返回新的Customization对象"""
+        custom = cls()
+        if is_compiled(filename):
+            custom.load_compiled(filename)
+        else:
+            custom.load_customization(filename, sep)
+        return custom
 
-                if len(phrase) < 2 and tags[0] == '':
-                    continue
+    @classmethod
+    def compile(cls, src, dst, sep=None):
+        """将文本格式的人工干预词典编译为可mmap装载的二进制词典
+        Args:
+            src: 文本词典路径
+            dst: 二进制词典的保存路径
+            sep: 表示词典中，短语片段的分隔符，默认为空格' '或制表符'\t'
+        Returns:
+            装载了src的Customization对象
+        """
+        custom = cls()
+        custom.load_customization(src, sep)
+        custom.save_compiled(dst)
+        return custom
+
+    def save_compiled(self, filename):
+        """将当前词典保存为二进制词典，包含AC自动机及各短语的标签和片段位置
+        内存中的词典使用DictAhocorasick，保存时构建数组实现的AC自动机
+        """
+        dictitem, ac = self.snapshot
+        if not isinstance(ac, ArrayAhocorasick):
+            ac = ArrayAhocorasick.build(dictitem)
+
+        tag_names, tag_ids = [], {}
+        node_item = array.array('i', [-1]) * len(ac)
+        item_first = array.array('i', [0])
+        seg_offset, seg_tag = array.array('i'), array.array('i')
+
+        for phrase in dictitem:
+            tags, offsets = dictitem[phrase]
+            node_item[ac.trie.find(phrase)] = len(item_first) - 1
+            for tag, offset in zip(tags, offsets):
+                if tag not in tag_ids:
+                    tag_ids[tag] = len(tag_names)
+                    tag_names.append(tag)
+                seg_tag.append(tag_ids[tag])
+                seg_offset.append(offset)
+            item_first.append(len(seg_tag))
+
+        # 标签名以换行符分隔，按utf-8编码保存
+        tag_text = array.array('B', bytearray(u'\n'.join(tag_names).encode('utf8')))
+
+        save_arrays(filename, CUSTOM_DICT_MAGIC,
+                    ac.to_arrays() + [('node_item', node_item),
+                                      ('item_first', item_first),
+                                      ('seg_offset', seg_offset),
+                                      ('seg_tag', seg_tag),
+                                      ('tag_text', tag_text)],
+                    CUSTOM_DICT_VERSION)
+
+    def load_compiled(self, filename):
+        """mmap装载compile生成的二进制词典，不解析文本，多进程间共享内存页"""
+        arrays = load_arrays(filename, CUSTOM_DICT_MAGIC, CUSTOM_DICT_VERSION)
+        tag_text = bytearray(arrays['tag_text']).decode('utf8')
 
-                self.dictitem[phrase] = (tags, offset)
-                self.ac.add_word(phrase)
-        self.ac.make()
+        ac = ArrayAhocorasick.from_arrays(arrays)
+        dictitem = CompiledDictItems(ac, arrays['node_item'], arrays['item_first'],
+                                     arrays['seg_offset'], arrays['seg_tag'],
+                                     tag_text.split(u'\n'))
+        with self._lock:
+            self._snapshot = (dictitem, ac)
+            self._pending = {}
+            self.compiled_path = filename
 
     def parse_customization(self, query, lac_tags):
         """使用人工干预词典修正lac模型的输出"""
-        if not self.ac:
+        # 同一次匹配只使用同一个snapshot，不受并发修改的影响
+        dictitem, ac = self.snapshot
+        if ac is None:
             logging.warning("customization dict is not load")
             return
 
         # FMM前向最大匹配
-        ac_res = self.ac.search(query)
+        ac_res = ac.search(query)
 
         for begin, end in ac_res:
             phrase = query[begin:end]
             index = begin
 
-            tags, offsets = self.dictitem[phrase]
+            tags, offsets = dictitem[phrase]
             for tag, offset in zip(tags, offsets):
                 while index < begin + offset:
                     if len(tag) == 0:
@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现长文档的切分与结果拼接。
+
+长文档按句末标点切分为不超过max_length的片段，超长的句子再按带重叠的窗口切分，
+各片段作为一个batch预测后，按原文位置拼接为整篇文档的结果。
+"""
+
+import re
+
+import numpy as np
+
+__all__ = [
+    'split_document',
+    'stitch',
+    'to_result',
+]
+
+# 句末标点及其后的引号、括号
+SENTENCE_END = re.compile(u'[。！？!?；;…\n]+[”’」』"\'）)]*')
+
+
+def split_document(text, max_length=512, overlap=32):
+    """将长文档切分为片段
+    相邻的句子合并为不超过max_length的片段，超过max_length的句子按窗口切分，
+    相邻窗口重叠overlap个字，用于在重叠区内选择两个窗口一致的词边界
+    Args:
+        text: 文档文本
+        max_length: 片段的最大长度
+        overlap: 超长句子切分时相邻窗口的重叠长度
+    Returns:
+        由(begin, end)组成的list，按原文顺序排列，覆盖整个文档
+    """
+    if not 0 <= overlap < max_length:
+        raise ValueError("overlap should be in [0, max_length)")
+
+    bounds = [match.end() for match in SENTENCE_END.finditer(text)]
+    if not bounds or bounds[-1] != len(text):
+        bounds.append(len(text))
+
+    spans = []
+    chunk_begin = last = 0
+    for bound in bounds:
+        if bound - chunk_begin <= max_length:
+            last = bound
+            continue
+
+        if last > chunk_begin:
+            spans.append((chunk_begin, last))
+            chunk_begin = last
+        if bound - chunk_begin > max_length:
+            # 单个句子超长，按窗口切分
+            begin = chunk_begin
+            while True:
+                end = min(begin + max_length, bound)
+                spans.append((begin, end))
+                if end == bound:
+                    break
+                begin = end - overlap
+            chunk_begin = bound
+        last = bound
+
+    if last > chunk_begin:
+        spans.append((chunk_begin, last))
+    return spans
+
+
+def _choose_cut(left_bounds, right_bounds, begin, end):
+    """在[begin, end]内选择拼接位置
+    优先选择两个窗口共同的、最接近区间中点的词边界，窗口边缘处的预测受上下文截断影响较大；
+    没有共同边界时选择右窗口最接近中点的词边界，左窗口中跨过该位置的词会被截断为两个词
+    """
+    for bounds in (np.intersect1d(left_bounds, right_bounds), right_bounds):
+        bounds = bounds[(bounds >= begin) & (bounds <= end)]
+        if len(bounds):
+            return int(bounds[np.argmin(np.abs(2 * bounds - (begin + end)))])
+    return end
+
+
+def stitch(spans, results):
+    """将各片段return_offsets模式的结果拼接为整篇文档的结果
+    Args:
+        spans: split_document的输出
+        results: 与spans一一对应的片段预测结果，每个为[词首位置, 词尾位置, ...]，
+                 其余各项为与词一一对应的数组，如标签编号和词语重要性
+    Returns:
+        与单个片段格式相同的结果，位置为在文档中的位置
+    """
+    starts = [result[0] + begin for (begin, end), result in zip(spans, results)]
+    ends = [result[1] + begin for (begin, end), result in zip(spans, results)]
+    bounds = [np.union1d(word_starts, word_ends) for word_starts, word_ends in zip(starts, ends)]
+
+    # 相邻片段之间的拼接位置，不重叠的片段在边界处拼接；
+    # overlap超过max_length的一半时重叠区会跨过多个窗口，拼接位置不小于前一个，保证有序
+    cuts = [spans[0][0]]
+    for i in range(len(spans) - 1):
+        if spans[i][1] <= spans[i + 1][0]:
+            cuts.append(spans[i][1])
+        else:
+            begin = max(spans[i + 1][0], cuts[-1])
+            cuts.append(_choose_cut(bounds[i], bounds[i + 1], begin, spans[i][1]))
+    cuts.append(spans[-1][1])
+
+    columns = [[] for _ in results[0]]
+    for i, result in enumerate(results):
+        # 保留与[cuts[i], cuts[i + 1])相交的词，在共同词边界处拼接时不会截断任何词
+        keep = (ends[i] > cuts[i]) & (starts[i] < cuts[i + 1]) & (cuts[i] < cuts[i + 1])
+        columns[0].append(np.maximum(starts[i][keep], cuts[i]))
+        columns[1].append(np.minimum(ends[i][keep], cuts[i + 1]))
+        for column, values in zip(columns[2:], result[2:]):
+            column.append(values[keep])
+
+    return [np.concatenate(column) for column in columns]
+
+
+def to_result(text, offsets, tag_names):
+    """将return_offsets模式的结果转为与LAC.run相同格式的明文结果
+    Args:
+        text: 原文
+        offsets: [词首位置, 词尾位置]，lac模式另有标签编号，rank模式另有词语重要性
+        tag_names: 标签编号对应的标签名
+    """
+    words = [text[begin:end] for begin, end in zip(offsets[0].tolist(), offsets[1].tolist())]
+    if len(offsets) == 2:
+        return words
+
+    tags = [tag_names[tag] for tag in offsets[2].tolist()]
+    if len(offsets) == 3:
+        return [words, tags]
+    return [words, tags, offsets[3].tolist()]
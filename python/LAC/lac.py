@@ -21,19 +21,20 @@
 """
 
 import os
+import copy
 import shutil
+import hashlib
 import logging
+import threading
+from multiprocessing.pool import ThreadPool
 
-import numpy as np
-import paddle.fluid as fluid
-from paddle.fluid.core import PaddleTensor
-from paddle.fluid.core import AnalysisConfig
-from paddle.fluid.core import create_paddle_predictor
-
-from . import nets
 from . import utils
 from . import reader
+from . import parallel
+from . import document
 from ._compat import *
+from .cache import LRUCache
+from .metrics import Metrics
 from .custom import Customization
 from .models import Model, SegModel, LacModel, RankModel
 
@@ -50,36 +51,232 @@ PATH_DICT = {
                 "rank":DEFAULT_RANK
              }
 
+def _file_signature(filename, check):
+    """计算用户词典文件的签名，用于判断文件是否变化
+    Args:
+        filename: 文件路径
+        check: "mtime"使用修改时间和文件大小，"checksum"使用文件内容的md5
+    """
+    if check == 'mtime':
+        stat = os.stat(filename)
+        return (stat.st_mtime, stat.st_size)
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def _copy_result(result):
+    """复制单条预测结果，避免调用方修改缓存中的结果"""
+    # return_offsets模式的结果为numpy数组，copy.copy会复制数组数据
+    return [list(item) if isinstance(item, list) else copy.copy(item) for item in result]
+
 class LAC(object):
     """Docstring for LAC"""
-    def __init__(self, model_path=None, mode='lac', use_cuda=False):
+    def __init__(self, model_path=None, mode='lac', use_cuda=False, max_batch_tokens=None,
+                 cache_size=0, lazy=False, fast_path=False, backend='paddle'):
+        """初始化LAC
+        Args:
+            model_path: 模型路径，为None时使用mode对应的默认模型
+            mode: 模型类型，可选"lac"、"seg"和"rank"
+            use_cuda: 是否使用GPU预测
+            max_batch_tokens: 开启按长度分桶的子batch调度，每个子batch的
+                              token数(最长文本长度 * 文本数)不超过该值，为None时不分桶
+            cache_size: 预测结果LRU缓存的条目数，为0时不缓存
+            lazy: 为True时推迟到第一次预测时才创建predictor，用于缩短启动时间
+            fast_path: 为True时整个文本是用户词典中的短语、纯数字或纯标点的输入
+                       不经过模型直接给出结果，rank模式不支持
+            backend: 预测后端，"paddle"或"numpy"，"numpy"不依赖Paddle，
+                     只支持CPU上的lac和seg模型
+        """
         super(LAC, self).__init__()
         utils.check_cuda(use_cuda)
 
         assert mode in PATH_DICT, 'The mode should be in "lac", "seg" or "rank"'
+        assert backend in ('paddle', 'numpy'), 'The backend should be "paddle" or "numpy"'
+        if backend == 'numpy' and use_cuda:
+            raise ValueError("numpy backend does not support use_cuda")
         model_path = model_path if model_path else PATH_DICT[mode]
 
         if mode == 'seg':
-            model = SegModel(model_path, mode, use_cuda)
+            model = SegModel(model_path, mode, use_cuda, lazy, backend)
         elif mode == 'lac':
-            model = LacModel(model_path, mode, use_cuda)
+            model = LacModel(model_path, mode, use_cuda, lazy, backend)
         elif mode == 'rank':
-            model = RankModel(model_path, mode, use_cuda)
+            model = RankModel(model_path, mode, use_cuda, lazy, backend)
 
         self.model = model
+        self.model.max_batch_tokens = max_batch_tokens
+        self.model.fast_path = fast_path
+        self.cache = LRUCache(cache_size) if cache_size else None
 
-    def run(self, texts):
+    def run(self, texts, return_offsets=False):
         """执行模型预测过程
         Args:
             texts: 模型输入的文本，一个Unicode编码的字符串或者
                    由Unicode编码字符串组成的List
+            return_offsets: 为True时不生成词语和标签字符串，每个文本的结果为numpy数组，
+                            由调用方按需切片原文，如text[starts[i]:ends[i]]
         Returns:
             if mode=='seg',  返回分词结果
             if mode=='lac',  返回分词,词性结果
             if mode=='rank', 返回分词,词性,词语重要性结果
+            return_offsets为True时，每个文本的结果为int64数组组成的list：
+            if mode=='seg',  [词首位置, 词尾位置(不含)]
+            if mode=='lac',  [词首位置, 词尾位置(不含), 标签编号]
+            if mode=='rank', [词首位置, 词尾位置(不含), 标签编号, 词语重要性]
+            标签编号为tag_names中的下标
         """
-        return self.model.run(texts)
+        metrics = self.model.metrics
+        if metrics is None:
+            return self._run(texts, return_offsets)
+
+        metrics.begin_run()
+        try:
+            return self._run(texts, return_offsets)
+        finally:
+            metrics.end_run()
+
+    def _run(self, texts, return_offsets=False):
+        """run的实现，开启缓存时只将未命中的文本送入模型"""
+        if self.cache is None:
+            return self.model.run(texts, return_offsets)
+
+        batch = isinstance(texts, list) or isinstance(texts, tuple)
+        texts = texts if batch else [texts]
+
+        # 命中缓存的文本直接返回结果，未命中的文本去重后送入模型
+        results = [None] * len(texts)
+        pending = {}
+        # 用户词典变化后generation增加，旧词典的结果不再被命中，也不会被写入新的key
+        generation = self.model.custom_state.generation
+        for index, text in enumerate(texts):
+            result = self.cache.get((self.model.mode, return_offsets, generation, text))
+            if result is None:
+                pending.setdefault(text, []).append(index)
+            else:
+                results[index] = _copy_result(result)
+
+        if self.model.metrics is not None:
+            misses = sum(len(indices) for indices in pending.values())
+            self.model.metrics.inc('cache_hits', len(texts) - misses)
+            self.model.metrics.inc('cache_misses', misses)
+
+        if pending:
+            pending_texts = list(pending)
+            for text, result in zip(pending_texts,
+                                    self.model.run(pending_texts, return_offsets)):
+                self.cache.put((self.model.mode, return_offsets, generation, text), result)
+                for index in pending[text]:
+                    results[index] = _copy_result(result)
+
+        return results if batch else results[0]
     
+    def run_iter(self, texts, batch_size=64, return_offsets=False):
+        """流式执行模型预测
+        惰性读取输入并按batch_size组batch预测，内存占用只与batch_size有关
+        Args:
+            texts: 可迭代对象，每个元素为一个Unicode编码的字符串，可以是生成器或文件对象
+            batch_size: 每次送入模型的文本数
+            return_offsets: 同run
+        Returns:
+            生成器，按输入顺序逐条产出与run相同格式的单条结果
+        """
+        for batch in reader.batch_iter(texts, batch_size):
+            for result in self.run(batch, return_offsets):
+                yield result
+
+    def run_document(self, text, max_length=512, overlap=32, batch_size=64, workers=1,
+                     return_offsets=False):
+        """预测一篇长文档
+        文档按句末标点切分为不超过max_length的片段，超长的句子按带重叠的窗口切分，
+        片段按batch_size组batch预测后拼接，词语不会在片段边界处被截断。
+        单个序列的长度和内存占用只与max_length有关
+        Args:
+            text: 一个Unicode编码的字符串
+            max_length: 片段的最大长度
+            overlap: 超长句子切分时相邻窗口的重叠长度
+            batch_size: 每次送入模型的片段数
+            workers: 并行预测的线程数，每个线程使用一个clone得到的对象
+            return_offsets: 同run
+        Returns:
+            与run(text)相同格式的结果，位置为在文档中的位置
+        """
+        text = strdecode(text)
+        spans = document.split_document(text, max_length, overlap)
+        if not spans:
+            return self.run(text, return_offsets)
+
+        batches = list(reader.batch_iter([text[begin:end] for begin, end in spans],
+                                         batch_size))
+        results = []
+        if workers > 1 and len(batches) > 1:
+            workers = min(workers, len(batches))
+            models = [self] + [self.clone() for _ in range(workers - 1)]
+            local = threading.local()
+
+            def _init_thread():
+                local.lac = models.pop()
+
+            def _run_batch(batch):
+                return local.lac.run(batch, return_offsets=True)
+
+            pool = ThreadPool(workers, _init_thread)
+            try:
+                for batch_result in pool.imap(_run_batch, batches):
+                    results.extend(batch_result)
+            finally:
+                pool.close()
+        else:
+            for batch in batches:
+                results.extend(self.run(batch, return_offsets=True))
+
+        offsets = document.stitch(spans, results)
+        if return_offsets:
+            return offsets
+        return document.to_result(text, offsets, self.tag_names)
+
+    def run_parallel(self, texts, workers=None, chunk_size=1000):
+        """多进程执行模型预测，适用于大规模语料的离线处理
+        每个工作进程装载一次模型，输入被惰性地按chunk分发，内存占用与输入总量无关
+        Args:
+            texts: 可迭代对象，每个元素为一个Unicode编码的字符串，如文件对象的行
+            workers: 工作进程数，为None时使用CPU核数
+            chunk_size: 每次分发给工作进程的文本数
+        Returns:
+            生成器，按输入顺序逐条产出与run相同格式的单条结果
+        """
+        return parallel.run_parallel(texts,
+                                     model_path=self.model.model_path,
+                                     mode=self.model.mode,
+                                     workers=workers,
+                                     chunk_size=chunk_size,
+                                     use_cuda=self.model.args.use_cuda,
+                                     max_batch_tokens=self.model.max_batch_tokens,
+                                     custom=self.model.custom,
+                                     backend=self.model.backend,
+                                     fast_path=self.model.fast_path)
+
+    @property
+    def tag_names(self):
+        """return_offsets模式下标签编号对应的标签名list
+        以模型的标签为前缀，用户词典中的新标签在第一次输出时追加到末尾，已有编号不会改变
+        """
+        return list(self.model.tag_table.names)
+
+    def clone(self):
+        """复制LAC对象用于多线程预测
+        复制得到的对象与原对象共享模型参数和词典，但拥有独立的predictor，
+        多线程服务时每个线程应持有一个clone得到的对象，无需重复装载模型
+        """
+        lac = copy.copy(self)
+        lac.model = self.model.clone()
+        # 缓存不共享，用户词典由custom_state共享，缓存key中的generation保证修改后不命中旧结果
+        if self.cache is not None:
+            lac.cache = LRUCache(self.cache.capacity)
+        return lac
+
     def train(self, model_save_dir, train_data, test_data=None, iter_num=10, thread_num=10):
         """执行模型增量训练
         Args:
@@ -90,26 +287,136 @@ class LAC(object):
             thread_num: 执行训练的线程数
         """
         self.model.train(model_save_dir, train_data, test_data, iter_num, thread_num)
+        self.clear_cache()
     
     def load_customization(self, customization_file, sep=None):
         """装载用户词典
 
         Args:
-            texts: 用户词典路径
+            texts: 用户词典路径，可以是文本词典或Customization.compile生成的二进制词典
             sep: 表示词典中，短语片段的分隔符，默认为空格' '或制表符'\t'
         """
-        self.model.custom = Customization()
-        self.model.custom.load_customization(customization_file, sep)
+        custom = Customization.from_file(customization_file, sep)
+        with self.model.custom_state.lock:
+            self.model.custom = custom
+            self._customization_changed()
+
+    def reload_customization(self, customization_file, sep=None, block=False, check='mtime'):
+        """热更新用户词典
+        在后台线程中装载新词典，装载完成后原子地替换当前词典并清空结果缓存，
+        替换前已开始的batch仍使用旧词典，预测不会被阻塞
+        Args:
+            customization_file: 用户词典路径，可以是文本词典或二进制词典
+            sep: 表示词典中，短语片段的分隔符，默认为空格' '或制表符'\t'
+            block: 为True时在当前线程中装载，返回后新词典已生效
+            check: 判断文件是否变化的方式，"mtime"比较修改时间和文件大小，
+                   "checksum"比较文件内容的md5，为None时总是重新装载
+        Returns:
+            block为True时返回是否替换了词典，否则返回执行装载的线程
+        """
+        assert check in ('mtime', 'checksum', None), \
+            'The check should be in "mtime", "checksum" or None'
+        if block:
+            return self._reload_customization(customization_file, sep, check)
+
+        thread = threading.Thread(target=self._reload_customization,
+                                  args=(customization_file, sep, check))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _reload_customization(self, customization_file, sep, check):
+        """装载并替换用户词典，同一时刻只有一次热更新在执行
+        词典保存在与clone共享的custom_state中，替换对所有clone及其工作线程同时生效
+        """
+        state = self.model.custom_state
+        with state.reload_lock:
+            try:
+                signature = None
+                if check is not None:
+                    signature = (check, _file_signature(customization_file, check))
+                    if signature == state.signature:
+                        return False
+
+                custom = Customization.from_file(customization_file, sep)
+            except Exception:
+                logging.exception("Failed to reload customization %s" % customization_file)
+                return False
+
+            # 属性赋值是原子的，进行中的batch持有旧词典的引用，
+            # 其结果以旧的generation写入缓存，不会再被命中
+            with state.lock:
+                self.model.custom = custom
+                self._customization_changed()
+                state.signature = signature
+            logging.info("Reloaded customization %s" % customization_file)
+            return True
     
     def add_word(self, word, sep=None):
         """添加单词，格式与用户词典一致
         Args:
             texts: 用户定义词典，如："春天"、"花 开"、"春天/SEASON"、"花/n 开/v"、
             sep: 表示词典中，短语片段的分隔符，默认为空格' '或制表符'\t'
+        逐个添加时用户词典在下一次预测前才重新构建，连续添加多个单词只构建一次
         """
-        if self.model.custom is None:
-            self.model.custom = Customization()
-        self.model.custom.add_word(word, sep)
+        with self.model.custom_state.lock:
+            if self.model.custom is None:
+                self.model.custom = Customization()
+            self.model.custom.add_word(word, sep)
+            self._customization_changed()
+
+    def add_words(self, words, sep=None):
+        """批量添加单词，所有单词添加完成后用户词典只重新构建一次
+        Args:
+            words: 可迭代对象，每个元素为与用户词典格式一致的字符串，如"花/n 开/v"，
+                   或已切分的(phrase, tags, offsets)，如(u"花开", ["n", "v"], [1, 2])
+            sep: 表示词典中，短语片段的分隔符，默认为空格' '或制表符'\t'
+        """
+        with self.model.custom_state.lock:
+            if self.model.custom is None:
+                self.model.custom = Customization()
+            self.model.custom.add_words(words, sep)
+            self._customization_changed()
+
+    def remove_word(self, word, sep=None):
+        """删除单词，格式与add_word一致
+        Returns:
+            单词是否存在
+        """
+        with self.model.custom_state.lock:
+            if self.model.custom is None or not self.model.custom.remove_word(word, sep):
+                return False
+            self._customization_changed()
+        return True
+
+    def _customization_changed(self):
+        """用户词典替换或修改后调用，需持有custom_state.lock
+        先替换词典再增加generation，读到新generation的预测一定使用新词典
+        """
+        state = self.model.custom_state
+        state.generation += 1
+        state.signature = None
+        self.clear_cache()
+
+    def enable_metrics(self, callback=None):
+        """开启分阶段耗时及计数统计
+        Args:
+            callback: 每次run结束时以该次run的统计(dict)为参数调用，为None时只累计统计
+        Returns:
+            metrics.Metrics对象，可通过snapshot()轮询或to_prometheus()导出
+        """
+        metrics = Metrics(callback)
+        self.model.set_metrics(metrics)
+        return metrics
+
+    def disable_metrics(self):
+        """关闭统计，预测过程不再有任何计时开销"""
+        self.model.set_metrics(None)
+
+    def clear_cache(self):
+        """清空预测结果缓存，模型或用户词典变化时自动调用"""
+        if self.cache is not None:
+            self.cache.clear()
 
 if __name__ == "__main__":
     print('######### mode = lac ##############')
@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现预测过程的分阶段耗时统计，支持Python轮询及导出为Prometheus文本格式。
+"""
+
+import time
+import threading
+from bisect import bisect_left
+
+# Python3使用高精度计时器
+timer = getattr(time, 'perf_counter', time.time)
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+COUNTERS = ('runs', 'texts', 'chars', 'batches', 'cache_hits', 'cache_misses', 'fast_path')
+
+
+class Histogram(object):
+    """固定分桶的直方图
+
+    Attributes:
+        buckets: 各分桶的上界，递增
+        counts: 落入各分桶的次数(非累计)，最后一个为+Inf分桶
+        sum: 观测值之和
+        count: 观测次数
+    """
+    __slots__ = ['buckets', 'counts', 'sum', 'count']
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """记录一个观测值"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """返回累计分桶形式的统计结果"""
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class Metrics(object):
+    """预测过程的统计信息
+
+    对每次run记录各阶段耗时、文本数、字数、子batch大小和缓存命中情况，
+    并累计为直方图和计数器。
+
+    Attributes:
+        callback: 每次run结束时以该次run的统计(dict)为参数调用，为None时不调用
+        stages: 阶段名到耗时直方图(秒)的映射
+        batch_size: 子batch文本数的直方图
+        counters: 计数器名到累计值的映射
+    """
+
+    def __init__(self, callback=None, time_buckets=TIME_BUCKETS):
+        self.callback = callback
+        self.time_buckets = time_buckets
+        self.stages = {}
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def begin_run(self):
+        """开始记录一次run，支持嵌套调用，只有最外层的run被统计"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._local.start = timer()
+            self._local.record = {"stages": {}, "batch_sizes": []}
+            self._local.record.update((name, 0) for name in COUNTERS if name != 'runs')
+        self._local.depth = depth + 1
+
+    def end_run(self):
+        """结束记录一次run，最外层的run结束时调用callback"""
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+
+        record = self._local.record
+        self._local.record = None
+        record["seconds"] = timer() - self._local.start
+        self.observe('run', record["seconds"])
+        self.inc('runs')
+
+        if self.callback is not None:
+            self.callback(record)
+
+    def observe(self, stage, seconds):
+        """记录一个阶段的耗时(秒)"""
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.time_buckets)
+            histogram.observe(seconds)
+
+        record = getattr(self._local, 'record', None)
+        if record is not None and stage != 'run':
+            record["stages"][stage] = record["stages"].get(stage, 0.0) + seconds
+
+    def observe_batch(self, texts):
+        """记录一个送入模型的子batch的文本数"""
+        with self._lock:
+            self.batch_size.observe(texts)
+
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            record["batch_sizes"].append(texts)
+        self.inc('batches')
+
+    def inc(self, name, value=1):
+        """累加计数器"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        record = getattr(self._local, 'record', None)
+        if record is not None and name in record:
+            record[name] += value
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self.stages = {}
+            self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+            self.counters = dict((name, 0) for name in COUNTERS)
+
+    def snapshot(self):
+        """返回当前的累计统计，用于在Python中轮询"""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": dict((stage, histogram.snapshot())
+                               for stage, histogram in self.stages.items()),
+                "batch_size": self.batch_size.snapshot(),
+            }
+
+    def to_prometheus(self, prefix='lac'):
+        """导出为Prometheus文本格式"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def _histogram(name, labels, histogram):
+            for bound, count in histogram["buckets"]:
+                lines.append('%s_bucket{%sle="%s"} %d' % (name, labels, bound, count))
+            labels = '{%s}' % labels.rstrip(',') if labels else ''
+            lines.append('%s_sum%s %r' % (name, labels, histogram["sum"]))
+            lines.append('%s_count%s %d' % (name, labels, histogram["count"]))
+
+        name = '%s_stage_seconds' % prefix
+        lines.append('# HELP %s Wall time of each inference stage.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        for stage in sorted(snapshot["stages"]):
+            _histogram(name, 'stage="%s",' % stage, snapshot["stages"][stage])
+
+        name = '%s_batch_size' % prefix
+        lines.append('# HELP %s Number of texts per predictor batch.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        _histogram(name, '', snapshot["batch_size"])
+
+        for counter in sorted(snapshot["counters"]):
+            name = '%s_%s_total' % (prefix, counter)
+            lines.append('# TYPE %s counter' % name)
+            lines.append('%s %d' % (name, snapshot["counters"][counter]))
+
+        return '\n'.join(lines) + '\n'
@@ -19,161 +19,494 @@
 本文件定义了Model基类以及它的子类:LacModel, SegModel, RankModel
 """ 
 import os
+import re
+import copy
 import shutil
 import logging
+import threading
+import unicodedata
 
 import numpy as np
-import paddle.fluid as fluid
-from paddle.fluid.core import PaddleTensor
-from paddle.fluid.core import AnalysisConfig
-from paddle.fluid.core import create_paddle_predictor
 
-from . import nets
 from . import utils
 from . import reader
+from . import registry
 from .segment import Segment
 from .custom import Customization
+from .metrics import timer
+from .predictor import BufferedPredictor
+
+# 纯数字(可带小数部分)的文本不经过模型，整体作为一个数词
+RE_DIGIT = re.compile(u'[0-9０-９]+(?:[.．][0-9０-９]+)?\\Z', re.U)
+
+
+def is_punctuation(text):
+    """文本是否全部由标点组成"""
+    return all(unicodedata.category(char).startswith('P') for char in text)
+
+class ZeroCopyPredictor(BufferedPredictor):
+    """基于ZeroCopyTensor的predictor封装
+
+    输入的id直接写入可复用的numpy缓冲区，由predictor的输入tensor拷贝，
+    输出直接以numpy数组读取，避免每次预测创建PaddleTensor及int64_data()列表。
+    输入缓冲区属于predictor，clone得到的predictor拥有独立的缓冲区
+
+    Attributes:
+        predictor: 关闭了feed/fetch op的paddle predictor
+        input_tensors: 按输入顺序排列的ZeroCopyTensor
+        output_tensors: 按输出顺序排列的ZeroCopyTensor
+    """
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.input_tensors = [predictor.get_input_tensor(name)
+                              for name in predictor.get_input_names()]
+        self.output_tensors = [predictor.get_output_tensor(name)
+                               for name in predictor.get_output_names()]
+        super(ZeroCopyPredictor, self).__init__(len(self.input_tensors))
+
+    def run(self, inputs):
+        """执行预测
+        Args:
+            inputs: list类型，每个输入为(数组, lod)，lod为二层list，与LoDTensor一致，
+                    输出可以直接作为另一个predictor的输入
+        Returns:
+            list类型，每个输出为(数组, lod)
+        """
+        for tensor, (data, lod) in zip(self.input_tensors, inputs):
+            tensor.reshape([len(data), 1])
+            tensor.set_lod(lod)
+            tensor.copy_from_cpu(np.ascontiguousarray(data).reshape(-1, 1))
+
+        self.predictor.zero_copy_run()
+        return [(tensor.copy_to_cpu(), tensor.lod()) for tensor in self.output_tensors]
+
+    def clone(self):
+        """复制predictor，共享模型参数，拥有独立的输入输出tensor及缓冲区"""
+        return ZeroCopyPredictor(self.predictor.clone())
+
+
+class TagTable(object):
+    """标签名与编号的映射，用于return_offsets模式输出标签编号
+
+    以模型的基础标签初始化，用户词典中出现的新标签在第一次输出时追加到末尾，
+    已分配的编号不会改变。同一模型clone得到的模型共享同一个TagTable
+
+    Attributes:
+        names: 按编号排列的标签名list
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._ids = dict((name, index) for index, name in enumerate(self.names))
+        self._lock = threading.Lock()
+
+    def ids(self, tags):
+        """将标签名数组转为编号数组"""
+        ids = []
+        for tag in tags:
+            index = self._ids.get(tag)
+            if index is None:
+                with self._lock:
+                    index = self._ids.get(tag)
+                    if index is None:
+                        index = len(self.names)
+                        self.names.append(tag)
+                        self._ids[tag] = index
+            ids.append(index)
+        return np.array(ids, dtype=np.int64)
+
+
+class CustomState(object):
+    """模型及其clone共享的用户词典状态
+
+    Attributes:
+        custom: 当前的Customization对象，为None时不进行干预
+        generation: 用户词典每次变化后加1，结果缓存的key包含该值，
+                    任一clone修改词典后所有clone中旧词典的缓存结果都不会再被命中
+        signature: 热更新装载的词典文件的签名，词典被其他方式修改后为None
+        lock: 修改用户词典时持有
+        reload_lock: 热更新时持有，同一时刻只有一次热更新在执行
+    """
+
+    def __init__(self):
+        self.custom = None
+        self.generation = 0
+        self.signature = None
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
 
 class Model(object):
     """Docstring for Model"""
-    def __init__(self, model_path, mode, use_cuda):
+    dataset_class = reader.Dataset
+    # fast_path中纯数字及纯标点文本的标签
+    digit_tag = 'm'
+    punctuation_tag = 'w'
+
+    def __init__(self, model_path, mode, use_cuda, lazy=False, backend='paddle'):
         super(Model, self).__init__()
 
         self.mode = mode
         self.model_path = model_path
+        self.backend = backend
 
         self.args = utils.DefaultArgs(self.model_path)
         self.args.use_cuda = use_cuda
 
         utils.check_cuda(self.args.use_cuda)
 
-        config = AnalysisConfig(self.args.init_checkpoint)
+        self.dataset = self.load_dataset()
+        self.tag_table = TagTable(self.dataset.tag_names)
+        # lazy为True时推迟到第一次预测时创建predictor，paddle也在此时才被import
+        self.predictor_path = self.args.init_checkpoint
+        self.predictor = None if lazy else self.create_predictor(self.predictor_path)
+        self._predictor_lock = threading.Lock()
+        self.segment_tool = None
+        self.custom_state = CustomState()
+        self.max_batch_tokens = None
+        self.metrics = None
+        self.fast_path = False
+
+    @property
+    def custom(self):
+        """当前的用户词典，与clone得到的模型共享"""
+        return self.custom_state.custom
+
+    @custom.setter
+    def custom(self, custom):
+        self.custom_state.custom = custom
+
+    def load_dataset(self):
+        """装载词表和标签表"""
+        return self.dataset_class(self.args)
+
+    def create_predictor(self, model_dir):
+        """创建预测用的predictor"""
+        if self.backend == 'numpy':
+            from .numpy_backend import BiGRUCRF, NumpyPredictor
+            # 模型参数只读，同一进程内由同一目录装载的模型共享
+            network = registry.shared('numpy_network', [model_dir],
+                                      lambda: BiGRUCRF.load(model_dir))
+            return NumpyPredictor(network)
+
+        from paddle.fluid.core import AnalysisConfig
+        from paddle.fluid.core import create_paddle_predictor
+
+        config = AnalysisConfig(model_dir)
         config.disable_glog_info()
-
+        # 使用ZeroCopyTensor输入输出
+        config.switch_use_feed_fetch_ops(False)
+        config.switch_specify_input_names(True)
         if self.args.use_cuda:
-            self.place = fluid.CUDAPlace(
-                int(os.getenv('FLAGS_selected_gpus', '0')))
             config.enable_use_gpu(memory_pool_init_size_mb=500,
                                   device_id=int(
                                       os.getenv('FLAGS_selected_gpus', '0')),
                                   )
-        else:
-            self.place = fluid.CPUPlace()
+        return ZeroCopyPredictor(create_paddle_predictor(config))
 
-        # init executor
-        self.exe = fluid.Executor(self.place)
-        self.dataset = reader.Dataset(self.args)
-        self.predictor = create_paddle_predictor(config)
-        self.segment_tool = None
-        self.custom = None
-        self.batch = False
-        
-    def run(self, texts):
-        """文本输入经过模型转为运行结果Tensor"""
-        self.empty_string = []
-        self.empty_return = {
-                            "empty": [[], [], []],
-                            "crf_result": [[[], [], []]]
-                            }
-        if isinstance(texts, list) or isinstance(texts, tuple):
-            self.batch = True
-        else:
-            if len(texts) == 0:
-                return self.empty_return
+    def ensure_predictor(self):
+        """lazy模式下第一次预测时创建predictor，多线程调用时只创建一次"""
+        if self.predictor is None:
+            with self._predictor_lock:
+                if self.predictor is None:
+                    self.predictor = self.create_predictor(self.predictor_path)
+
+    def run(self, texts, return_offsets=False):
+        """文本输入经过模型转为运行结果
+        Args:
+            texts: 一个Unicode编码的字符串或者由Unicode编码字符串组成的List
+            return_offsets: 为True时每个文本的解析结果为numpy数组，见parse_result
+        Returns:
+            dict类型，"crf_result"为与输入顺序一一对应的解析结果，
+            "batch"表示输入是否为List
+        """
+        self.ensure_predictor()
+        if self.metrics is None:
+            return self._run(texts, return_offsets)
+
+        self.metrics.begin_run()
+        try:
+            return self._run(texts, return_offsets)
+        finally:
+            self.metrics.end_run()
+
+    def empty_result(self, return_offsets):
+        """空字符串的解析结果"""
+        if return_offsets:
+            return [np.zeros(0, dtype=np.int64) for _ in range(3)]
+        return [[], [], []]
+
+    def _run(self, texts, return_offsets=False):
+        """run的实现"""
+        # 每次调用的中间状态均为局部变量，输入缓冲区属于predictor，多线程时各线程应使用clone得到的模型
+        batch = isinstance(texts, list) or isinstance(texts, tuple)
+        if not batch:
             texts = [texts]
-            self.batch = False
-        
-        for i in range(len(texts)-1, -1, -1):
-            if len(texts[i]) == 0:
-                self.empty_string.append(i)
-                texts.pop(i)
-            
-        if len(texts) == 0:
-            return {
-                    "crf_result": self.empty_return["crf_result"] * len(self.empty_string)
-                    }
-
-        tensor_words, words_length = self.texts2tensor(texts)
-        crf_decode = self.predictor.run([tensor_words])
-        crf_result = self.parse_result(texts, crf_decode[0], self.dataset, words_length)
-
-        for _ in self.empty_string:
-            crf_result.insert(_, self.empty_return["empty"])
-
-        return {
-                "crf_decode": crf_decode,
-                "crf_result": crf_result,
-                "tensor_words": tensor_words,
-                "words_length": words_length
-                }   
-
-    def to_tensor(self, data, lod, dtype="int64"):
-        """Ids to Tensor"""
-        data_np = np.array(data, dtype)
-        tensor = fluid.core.PaddleTensor(data_np)
-        tensor.lod = [lod]
-        tensor.shape = [lod[-1], 1]
-        return tensor
+
+        # 空字符串不送入模型，直接返回空结果
+        crf_result = [self.empty_result(return_offsets) for _ in texts]
+        indices = [i for i, text in enumerate(texts) if len(text) != 0]
+
+        if self.metrics is not None:
+            self.metrics.inc('texts', len(texts))
+            self.metrics.inc('chars', sum(len(text) for text in texts))
+
+        if self.fast_path and indices:
+            indices = self.timed('fast_path', self.resolve_fast_path,
+                                 texts, indices, crf_result, return_offsets)
+
+        for sub_batch in self.split_batch(texts, indices):
+            if self.metrics is not None:
+                self.metrics.observe_batch(len(sub_batch))
+
+            batch_result = self._predict([texts[i] for i in sub_batch], return_offsets)
+            for index, result in zip(sub_batch, batch_result):
+                crf_result[index] = result
+
+        return {"crf_result": crf_result, "batch": batch}
+
+    def resolve_fast_path(self, texts, indices, crf_result, return_offsets):
+        """不经过模型直接给出可由规则或用户词典确定的文本的结果
+        Args:
+            texts: 模型输入的文本
+            indices: 非空文本的下标
+            crf_result: 各文本的结果，被确定的文本的结果被原地填充
+            return_offsets: 结果格式，同parse_result
+        Returns:
+            仍需送入模型的文本下标
+        """
+        custom = self.custom
+        pending = []
+        for index in indices:
+            result = self.fast_result(texts[index], custom, return_offsets)
+            if result is None:
+                pending.append(index)
+            else:
+                crf_result[index] = result
+
+        if self.metrics is not None:
+            self.metrics.inc('fast_path', len(indices) - len(pending))
+        return pending
+
+    def fast_result(self, text, custom, return_offsets):
+        """由规则或用户词典确定单个文本的结果，与模型预测后再干预的结果一致
+        可以确定的文本为：整个文本是用户词典中的一个短语且各片段都有标签，
+        或文本全部由数字或标点组成且不含用户词典中的短语
+        Returns:
+            与parse_result格式相同的单个文本的结果，无法确定时返回None
+        """
+        if custom:
+            dictitem, ac = custom.snapshot
+            if ac is not None:
+                if text in dictitem:
+                    tags, offsets = dictitem[text]
+                    # 无标签的片段沿用模型预测的标签
+                    if '' in tags and self.mode != 'seg':
+                        return None
+                    return self.make_result(text, offsets, tags, return_offsets)
+                if ac.search(text):
+                    return None
+
+        if RE_DIGIT.match(text):
+            tag = self.digit_tag
+        elif is_punctuation(text):
+            tag = self.punctuation_tag
+        else:
+            return None
+        return self.make_result(text, [len(text)], [tag], return_offsets)
+
+    def make_result(self, text, offsets, tags, return_offsets):
+        """由各词的结束位置和标签生成与parse_result格式相同的结果"""
+        ends = np.array(offsets, dtype=np.int64)
+        starts = np.append(np.zeros(1, dtype=np.int64), ends[:-1])
+        if return_offsets:
+            return [starts, ends, self.tag_table.ids(tags)]
+
+        words = [text[begin:end] for begin, end in zip(starts.tolist(), offsets)]
+        return [words, list(tags), starts]
+
+    def set_metrics(self, metrics):
+        """设置统计对象，为None时关闭统计
+        Args:
+            metrics: metrics.Metrics对象，记录每次run各阶段的耗时及计数
+        """
+        self.metrics = metrics
+
+    def timed(self, stage, func, *args):
+        """执行func，开启统计时记录该阶段的耗时"""
+        if self.metrics is None:
+            return func(*args)
+
+        start = timer()
+        result = func(*args)
+        self.metrics.observe(stage, timer() - start)
+        return result
+
+    def split_batch(self, texts, indices):
+        """将待预测的文本划分为多个子batch
+        未设置max_batch_tokens时所有文本作为一个batch；否则按文本长度排序分桶，
+        每个子batch的token数(最长文本长度 * 文本数)不超过max_batch_tokens
+        Args:
+            texts: 模型输入的文本
+            indices: 需要送入模型的文本下标
+        Returns:
+            由下标list组成的list，每个元素为一个子batch
+        """
+        if not self.max_batch_tokens:
+            return [indices] if indices else []
+
+        batches, batch = [], []
+        for index in sorted(indices, key=lambda i: len(texts[i])):
+            # 已排序，当前文本即为加入后子batch中最长的文本
+            if batch and (len(batch) + 1) * len(texts[index]) > self.max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _predict(self, texts, return_offsets=False):
+        """对一个batch的非空文本执行预测并解析结果"""
+        tensor_words, words_length = self.timed('texts2tensor', self.texts2tensor, texts)
+        crf_decode = self.timed('predictor.run', self.predictor.run, [tensor_words])
+        return self.timed('parse_result', self.parse_result,
+                          texts, crf_decode[0], self.dataset, words_length, return_offsets)
+
+    def clone(self):
+        """复制模型用于多线程预测
+        复制得到的模型与原模型共享参数、词典及用户词典，但拥有独立的predictor，
+        每个线程应使用各自的模型进行预测
+        """
+        self.ensure_predictor()
+        model = copy.copy(self)
+        model.predictor = self.predictor.clone()
+        return model
+
+    def to_tensor(self, ids, lod):
+        """将一个batch的id写入predictor的输入缓冲区
+        Args:
+            ids: 所有文本的id依次拼接而成的一维数组
+            lod: 每个文本在输入中的起始位置，最后一个元素为总长度
+        Returns:
+            (ids, [lod])，ids为缓冲区上的一维int64数组，可直接作为predictor的输入
+        """
+        data = self.predictor.input_buffer(0, lod[-1])
+        data[:] = ids
+        return data, [lod]
 
     def texts2tensor(self, texts):
         """文本输入转为Paddle输入的Tensor,适用于lac与rank
         Args:
             texts: 由string组成的list，模型输入的文本     
         Returns:
-            tensor: Paddle模型输入用的文本Tensor
-            words_length: 记录送入模型的每一个单词的长度
+            tensor: Paddle模型的输入，(ids, lod)
+            words_length: 送入模型的每一个单词的长度，与ids等长的一维数组
         """
-        lod, data, words_length = [0], [], []
-        for i, text in enumerate(texts):  
+        segments = self.timed('fast_cut', self.segment_tool.fast_cut_batch, texts)
+        ids, words_length, lod = self.dataset.encode_segments(segments)
 
-            text = self.segment_tool.fast_cut(text)
-            text_inds, word_length = self.dataset.text_to_ids(text)
-            words_length.append(word_length)
+        tensor = self.to_tensor(ids, lod) if lod[-1] != 0 else None
 
-            data += text_inds
-            lod.append(len(text_inds) + lod[i])
+        return tensor, words_length
 
-        tensor = self.to_tensor(data, lod) if len(data) != 0 else None
+    def parse_customization(self, lines, char_lod, tags, custom):
+        """使用用户词典干预字粒度的标签
+        用户词典基于标签字符串进行干预，整个batch的标签需先转为字符串再转回数组，
+        开销与batch的字数成正比，未装载用户词典时不经过这一步
+        Args:
+            lines: 模型输入的文本
+            char_lod: 每个文本在字粒度标签中的起始位置，最后一个元素为总字数
+            tags: 整个batch字粒度的标签字符串列表，如"n-B"
+            custom: parse_result开始时取得的用户词典，用户词典热更新时同一batch使用同一词典
+        Returns:
+            干预后每个字是否为词首的bool数组，以及每个字的基础标签数组
+        """
+        def _parse():
+            for sent_index, sent in enumerate(lines):
+                begin, end = char_lod[sent_index], char_lod[sent_index + 1]
+                sent_tags = tags[begin:end]
+                custom.parse_customization(sent, sent_tags)
+                tags[begin:end] = sent_tags
+        self.timed('customization', _parse)
+
+        is_begin = np.array([tag.endswith("B") or tag.endswith("S")
+                             for tag in tags], dtype=bool)
+        char_tags = np.array([tag[:-2] for tag in tags], dtype=object)
+        return is_begin, char_tags
+
+    def parse_result(self, lines, crf_decode, dataset, words_length, return_offsets=False):
+        """将模型输出的Tensor转为明文
+        整个batch的字拼接为一个序列一同解码，再按各文本的起始位置切分
+        Args:
+            lines: 模型输入的文本
+            crf_decode: 模型输出，(ids, lod)
+            dataset: 模型的词表和标签表
+            words_length: 送入模型的每一个单词的长度，为None时输入为字粒度
+            return_offsets: 为False时每个文本的结果为[词语列表, 标签列表, 词首位置数组]；
+                            为True时不生成字符串，结果为[词首位置, 词尾位置(不含), 标签编号]
+                            三个int64数组，标签编号对应tag_table.names
+        """
+        ids = crf_decode[0].reshape(-1)
+        char_lod = [0]
+        for line in lines:
+            char_lod.append(char_lod[-1] + len(line))
+
+        if words_length is None:
+            char_labels = ids
+            is_begin = dataset.label_begin[ids]
+        else:
+            # 重新填充被省略的单词的char部分，词内非首字的标签均为对应的I标签
+            char_labels = np.repeat(ids, words_length)
+            token_pos = np.cumsum(words_length) - words_length
+            is_begin = np.zeros(len(char_labels), dtype=bool)
+            is_begin[token_pos] = dataset.label_begin[ids]
+
+        # 用户词典可能被热更新替换，同一batch内使用同一词典
+        custom = self.custom
+        char_tags = None
+        if custom:
+            if words_length is None:
+                tags = [dataset.id2label[id] for id in ids.tolist()]
+            else:
+                tags = [tag + '-I' for tag in dataset.label_tags[char_labels].tolist()]
+                for pos, id in zip(token_pos.tolist(), ids.tolist()):
+                    tags[pos] = dataset.id2label[id]
+            is_begin, char_tags = self.parse_customization(lines, char_lod, tags, custom)
+
+        # 每个文本的第一个字总是作为词首，因此词不会跨越文本
+        is_begin[char_lod[:-1]] = True
+        starts = np.flatnonzero(is_begin)
+        ends = np.append(starts[1:], len(is_begin))
+        # 每个文本的词在starts中的范围，以及词在各自文本中的位置
+        bounds = np.searchsorted(starts, char_lod)
+        sent_offsets = np.repeat(char_lod[:-1], np.diff(bounds))
+        bounds = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        local_starts = starts - sent_offsets
+        word_starts = [local_starts[begin:end] for begin, end in bounds]
+
+        # 取词中最后一个字的标签作为词的标签
+        last_chars = ends - 1
+        if return_offsets:
+            if char_tags is not None:
+                # 用户词典可能引入新的标签
+                tag_ids = self.tag_table.ids(char_tags[last_chars].tolist())
+            else:
+                tag_ids = dataset.label_tag_ids[char_labels[last_chars]]
+            local_ends = ends - sent_offsets
+            return [[sent_starts, local_ends[begin:end], tag_ids[begin:end]]
+                    for (begin, end), sent_starts in zip(bounds, word_starts)]
 
-        return tensor, words_length
+        if char_tags is None:
+            tags = dataset.label_tags[char_labels[last_chars]].tolist()
+        else:
+            tags = char_tags[last_chars].tolist()
+        text = "".join(lines)
+        words = [text[begin:end] for begin, end in zip(starts.tolist(), ends.tolist())]
+        return [[words[begin:end], tags[begin:end], sent_starts]
+                for (begin, end), sent_starts in zip(bounds, word_starts)]
 
-    def parse_result(self, lines, crf_decode, dataset, words_length):
-        """将LAC模型输出的Tensor转为明文"""
-        offset_list = crf_decode.lod[0]
-        crf_decode = crf_decode.data.int64_data()
-        batch_size = len(offset_list) - 1
-
-        batch_out = []
-        for sent_index in range(batch_size):
-            begin, end = offset_list[sent_index], offset_list[sent_index + 1]
-
-            sent = lines[sent_index]
-            tags = [dataset.id2label_dict[str(id)]
-                    for id in crf_decode[begin:end]]
-
-            # 重新填充被省略的单词的char部分
-            word_length = words_length[sent_index]
-            for current in range(len(word_length)-1, -1, -1):
-                for offset in range(1, word_length[current]):
-                    tags.insert(current + offset, tags[current][:-2] + '-I')
-
-            if self.custom:
-                self.custom.parse_customization(sent, tags)
-
-            sent_out, tags_out = [], []
-            for ind, tag in enumerate(tags):
-                # for the first char
-                if len(sent_out) == 0 or tag.endswith("B") or tag.endswith("S"):
-                    sent_out.append(sent[ind])
-                    tags_out.append(tag[:-2])
-                    continue
-                sent_out[-1] += sent[ind]
-                # 取最后一个tag作为标签	
-                tags_out[-1] = tag[:-2]
-
-            batch_out.append([sent_out, tags_out, tags])
-        return batch_out
-    
     def train(self, model_save_dir, train_data, test_data, iter_num, thread_num):
         """执行模型增量训练
         Args:
@@ -190,6 +523,16 @@ class Model(object):
         self.args.cpu_num = thread_num
         logging.info("Start Training!")
 
+        # 训练相关的模块只在训练时import
+        import paddle.fluid as fluid
+        from . import nets
+
+        if self.args.use_cuda:
+            place = fluid.CUDAPlace(int(os.getenv('FLAGS_selected_gpus', '0')))
+        else:
+            place = fluid.CPUPlace()
+        exe = fluid.Executor(place)
+
         scope = fluid.core.Scope()
         with fluid.scope_guard(scope):
             test_program, fetch_list = nets.do_train(self.args, self.dataset, self.segment_tool)
@@ -197,7 +540,7 @@ class Model(object):
             fluid.io.save_inference_model(os.path.join(model_save_dir, 'model'),
                                           ['words'],
                                           fetch_list,
-                                          self.exe,
+                                          exe,
                                           main_program=test_program,
                                           )
         # 拷贝配置文件
@@ -214,164 +557,148 @@ class Model(object):
         use_cuda = self.args.use_cuda
         self.args = utils.DefaultArgs(model_dir)
         self.args.use_cuda = use_cuda
-        self.dataset = reader.Dataset(self.args)
+        self.dataset = self.load_dataset()
+        self.tag_table = TagTable(self.dataset.tag_names)
         self.model = self.args.model
 
         self.model_path = model_dir
-        config = AnalysisConfig(os.path.join(model_dir, 'model'))
-        config.disable_glog_info()
-        if self.args.use_cuda:
-            config.enable_use_gpu(memory_pool_init_size_mb=500,
-                                  device_id=int(
-                                      os.getenv('FLAGS_selected_gpus', '0')),
-                                  )
-        self.predictor = create_paddle_predictor(config)
+        self.predictor_path = os.path.join(model_dir, 'model')
+        self.predictor = self.create_predictor(self.predictor_path)
 
 class LacModel(Model):
     """Docstring for LAC Model"""
-    def __init__(self, model_path, mode, use_cuda):
-        super(LacModel, self).__init__(model_path, mode, use_cuda) 
+    def __init__(self, model_path, mode, use_cuda, lazy=False, backend='paddle'):
+        super(LacModel, self).__init__(model_path, mode, use_cuda, lazy, backend)
 
         seg_dict_path = os.path.join(model_path, "conf", "small_seg.dic")
-        self.segment_tool = Segment(dict_path=seg_dict_path)
-
-    def run(self, texts):
-        crf_result = super(LacModel, self).run(texts)['crf_result']
-        result = [[word, tag] for word, tag, tag_for_rank in crf_result] if self.batch else crf_result[0][:-1]
-        return result
-
-    def call_run(self, texts):
-        """lac被rank模型调用时返回的结果"""
-        lac_result = super(LacModel, self).run(texts)
-        return lac_result
+        # 分词词典只读，同一进程内由同一文件创建的模型共享
+        self.segment_tool = registry.shared('segment', [seg_dict_path],
+                                            lambda: Segment(dict_path=seg_dict_path))
+
+    def run(self, texts, return_offsets=False):
+        lac_result = super(LacModel, self).run(texts, return_offsets)
+        if return_offsets:
+            result = lac_result["crf_result"]
+        else:
+            result = [[word, tag] for word, tag, tag_for_rank in lac_result["crf_result"]]
+        return result if lac_result["batch"] else result[0]
 
 class SegModel(Model):
     """Docstring for Seg Model"""
-    def __init__(self, model_path, mode, use_cuda):
-        super(SegModel, self).__init__(model_path, mode, use_cuda) 
-        self.dataset = reader.SegDataset(self.args)
+    dataset_class = reader.SegDataset
+    # 分词模型的结果不含标签
+    digit_tag = ''
+    punctuation_tag = ''
+
+    def __init__(self, model_path, mode, use_cuda, lazy=False, backend='paddle'):
+        super(SegModel, self).__init__(model_path, mode, use_cuda, lazy, backend)
     
-    def run(self, texts):
-        crf_result = super(SegModel, self).run(texts)["crf_result"]
-        result = [word for word, tag, tag_for_rank in crf_result] if self.batch else crf_result[0][0]
-        return result
+    def run(self, texts, return_offsets=False):
+        seg_result = super(SegModel, self).run(texts, return_offsets)
+        if return_offsets:
+            result = [[starts, ends] for starts, ends, tag_ids in seg_result["crf_result"]]
+        else:
+            result = [word for word, tag, tag_for_rank in seg_result["crf_result"]]
+        return result if seg_result["batch"] else result[0]
     
     def texts2tensor(self, texts):
         """文本输入转为Paddle输入的Tensor"""
-        lod, data, words_length = [0], [], []
-        for i, text in enumerate(texts):
-
-            text_inds = self.dataset.word_to_ids(text)
-            data += text_inds
-            lod.append(len(text_inds) + lod[i])
+        ids, lod = self.dataset.encode_texts(texts)
+        tensor = self.to_tensor(ids, lod) if lod[-1] != 0 else None
 
-        tensor = self.to_tensor(data, lod) if len(data) != 0 else None
-
-        return tensor, words_length
+        return tensor, None
     
-    def parse_result(self, lines, crf_decode, dataset, words_length):
-        """将SEG模型输出的Tensor转为明文"""
-        offset_list = crf_decode.lod[0]
-        crf_decode = crf_decode.data.int64_data()
-        batch_size = len(offset_list) - 1
-
-        batch_out = []
-        for sent_index in range(batch_size):
-            begin, end = offset_list[sent_index], offset_list[sent_index + 1]
-
-            sent = lines[sent_index]
-            tags = [dataset.id2label_dict[str(id)]
-                    for id in crf_decode[begin:end]]
-            tags_for_rank = []
-
-            if self.custom:
-                self.custom.parse_customization(sent, tags)
-
-            sent_out, tags_out = [], []
-            for ind, tag in enumerate(tags):
-                # for the first char
-                if len(sent_out) == 0 or tag.endswith("B") or tag.endswith("S"):
-                    sent_out.append(sent[ind])
-                    tags_out.append(tag[:-2])
-                    continue
-                sent_out[-1] += sent[ind]
-                # 取最后一个tag作为标签	
-                tags_out[-1] = tag[:-2]
-
-            sent_out = [''] if len(sent_out) == 0 else sent_out
-            batch_out.append([sent_out, tags_out, tags_for_rank])
-        return batch_out
-
 class RankModel(Model):
     """Docstring for Rank Model"""
-    def __init__(self, model_path, mode, use_cuda):
-        # init rank model
-        super(RankModel, self).__init__(model_path, mode, use_cuda) 
+    def __init__(self, model_path, mode, use_cuda, lazy=False, backend='paddle'):
+        if backend != 'paddle':
+            raise ValueError("rank model only supports the paddle backend")
 
         # parsing the lac model address
         parent_path = os.path.split(model_path)[0]
         lac_path = os.path.join(parent_path, 'lac_model')
 
-        # init lac model
-        self.lac = LacModel(model_path=lac_path, mode='lac', use_cuda=use_cuda) 
-
-    def run(self, texts):
-        if self.custom is not None:
-            self.lac.custom = self.custom
-            
-        lac_result = self.lac.call_run(texts)
-        self.batch = self.lac.batch
-
-        if len(lac_result) != 4:
-            return lac_result["crf_result"]
-        
-        crf_decode = lac_result["crf_decode"]
-        crf_result = lac_result["crf_result"]
-        tensor_words = lac_result["tensor_words"]
-        words_length = lac_result["words_length"]
-
-        result = [[word, tag] for word, tag, tag_for_rank in crf_result]
-        tags_for_rank = [tag_for_rank for word, tag, tag_for_rank in crf_result if len(tag_for_rank) != 0]
-
-        rank_decode = self.predictor.run([tensor_words, crf_decode[0]])
-        weight = self.parse_result(tags_for_rank, rank_decode[0], words_length)
-
-        for _ in range(len(result)):
-            if len(result[_][0]) == 0:
-                result[_].append([])
-            else:
-                result[_].append(weight.pop(0))
-
-        return result if self.batch else result[0]
-
-    def parse_result(self, tags_for_rank, result, words_length):
-        """将RANK模型输出的Tensor转为明文"""
-        offset_list = result.lod[0]
-        rank_weight = result.data.int64_data()
-        batch_size = len(offset_list) - 1
-
-        batch_out = []
-        for sent_index in range(batch_size):
-            begin, end = offset_list[sent_index], offset_list[sent_index + 1]
-
-            tags = tags_for_rank[sent_index]
-            word_length = words_length[sent_index]
-            weight = rank_weight[begin:end]
-
-            # 重新填充被省略的单词的char部分
-            for current in range(len(word_length)-1, -1, -1):
-                for offset in range(1, word_length[current]):
-                    weight.insert(current + offset, weight[current])
-
-            weight_out = []
-            for ind, tag in enumerate(tags):
-                if len(weight_out) == 0 or tag.endswith("B") or tag.endswith("S"):
-                    weight_out.append(weight[ind])
-                    continue
-                weight_out[-1] = max(weight_out[-1], weight[ind])
-
-            batch_out.append(weight_out)
-        return batch_out
+        # init lac model, rank模型的输入由lac模型生成，二者共享词表
+        self.lac = LacModel(model_path=lac_path, mode='lac', use_cuda=use_cuda, lazy=lazy)
+
+        # init rank model
+        super(RankModel, self).__init__(model_path, mode, use_cuda, lazy)
+        # 词语的标签由lac模型给出，用户词典作用于lac模型
+        self.tag_table = self.lac.tag_table
+        self.lac.custom_state = self.custom_state
+
+    def load_dataset(self):
+        """rank模型的输入由lac模型生成，直接使用lac模型的词表"""
+        return self.lac.dataset
+
+    def ensure_predictor(self):
+        super(RankModel, self).ensure_predictor()
+        self.lac.ensure_predictor()
+
+    def run(self, texts, return_offsets=False):
+        rank_result = super(RankModel, self).run(texts, return_offsets)
+        result = rank_result["crf_result"]
+        return result if rank_result["batch"] else result[0]
+
+    def set_metrics(self, metrics):
+        super(RankModel, self).set_metrics(metrics)
+        self.lac.set_metrics(metrics)
+
+    def clone(self):
+        model = super(RankModel, self).clone()
+        model.lac = self.lac.clone()
+        return model
+
+    def empty_result(self, return_offsets):
+        if return_offsets:
+            return [np.zeros(0, dtype=np.int64) for _ in range(4)]
+        return [[], [], []]
+
+    def fast_result(self, text, custom, return_offsets):
+        """词语重要性只能由模型给出，rank模型不使用fast_path"""
+        return None
+
+    def _predict(self, texts, return_offsets=False):
+        """执行lac模型预测，并以其结果作为rank模型的输入"""
+        tensor_words, words_length = self.timed('texts2tensor', self.lac.texts2tensor, texts)
+        crf_decode = self.timed('predictor.run', self.lac.predictor.run, [tensor_words])
+        crf_result = self.timed('parse_result', self.lac.parse_result,
+                                texts, crf_decode[0], self.lac.dataset, words_length,
+                                return_offsets)
+
+        # 两种模式下词首位置分别为结果的第一项和第三项
+        word_starts = [result[0] if return_offsets else result[2] for result in crf_result]
+        rank_decode = self.timed('rank_predictor.run', self.predictor.run,
+                                 [tensor_words, crf_decode[0]])
+        weight = self.timed('rank_parse_result', self.parse_result,
+                            word_starts, rank_decode[0], words_length, return_offsets)
+
+        if return_offsets:
+            return [result + [word_rank] for result, word_rank in zip(crf_result, weight)]
+        return [[word, tag, word_rank]
+                for (word, tag, starts), word_rank in zip(crf_result, weight)]
+
+    def parse_result(self, word_starts, result, words_length, return_offsets=False):
+        """将RANK模型输出的Tensor转为明文，return_offsets为True时每个文本的结果为int64数组"""
+        rank_weight, lod = result
+        # 重新填充被省略的单词的char部分
+        weight = np.repeat(rank_weight.reshape(-1), words_length)
+
+        # 各文本在字粒度序列中的起始位置，及各词在整个batch中的起始位置
+        char_pos = np.zeros(len(words_length) + 1, dtype=np.int64)
+        np.cumsum(words_length, out=char_pos[1:])
+        char_lod = char_pos[lod[0]]
+        counts = [len(starts) for starts in word_starts]
+        starts = np.concatenate(word_starts) + np.repeat(char_lod[:-1], counts)
+
+        # 词语的重要性取词中各字重要性的最大值，文本的第一个字总是词首，不会跨越文本
+        weight_out = np.maximum.reduceat(weight, starts)
+        if return_offsets:
+            weight_out = weight_out.astype(np.int64)
+        else:
+            weight_out = weight_out.tolist()
+        bounds = np.cumsum([0] + counts).tolist()
+        return [weight_out[begin:end] for begin, end in zip(bounds[:-1], bounds[1:])]
 
     def train(self, model_save_dir, train_data, test_data, iter_num, thread_num):
         logging.info("To be continued...")
@@ -0,0 +1,304 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现不依赖Paddle的NumPy预测后端。
+
+直接读取save_inference_model保存的参数文件，按nets.lex_net的结构执行
+embedding -> 多层BiGRU -> FC -> CRF解码，适用于lac和seg模型，不支持rank模型。
+
+使用示例：
+    lac = LAC(mode='lac', backend='numpy')
+"""
+
+import os
+import re
+import struct
+
+import numpy as np
+
+from .predictor import BufferedPredictor
+
+__all__ = [
+    'load_lod_tensor',
+    'BiGRUCRF',
+    'NumpyPredictor',
+]
+
+# framework.proto中VarType.Type到numpy类型的映射
+PADDLE_DTYPES = {
+    0: np.bool_,
+    1: np.int16,
+    2: np.int32,
+    3: np.int64,
+    4: np.float16,
+    5: np.float32,
+    6: np.float64,
+    20: np.uint8,
+    21: np.int8,
+}
+
+
+def _read_varint(data, pos):
+    """读取protobuf的varint，返回(值, 新位置)"""
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_tensor_desc(data):
+    """解析TensorDesc，data_type为字段1，dims为字段2"""
+    data_type, dims, pos = None, [], 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+            if field == 1:
+                data_type = value
+            elif field == 2:
+                dims.append(value)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            end = pos + length
+            # packed编码的dims
+            while field == 2 and pos < end:
+                value, pos = _read_varint(data, pos)
+                dims.append(value)
+            pos = end
+        else:
+            raise ValueError("unsupported wire type %d in TensorDesc" % wire_type)
+    return data_type, dims
+
+
+def load_lod_tensor(filename):
+    """读取Paddle保存的单个LoDTensor参数文件
+    文件依次为：uint32版本号，uint64 lod层数及各层数据，uint32 tensor版本号，
+    int32 TensorDesc长度，TensorDesc，tensor数据
+    Returns:
+        numpy数组
+    """
+    with open(filename, 'rb') as f:
+        data = bytearray(f.read())
+
+    pos = 4
+    lod_level, = struct.unpack_from('<Q', data, pos)
+    pos += 8
+    for _ in range(lod_level):
+        size, = struct.unpack_from('<Q', data, pos)
+        pos += 8 + size
+
+    pos += 4
+    desc_size, = struct.unpack_from('<i', data, pos)
+    pos += 4
+    data_type, dims = _parse_tensor_desc(data[pos:pos + desc_size])
+    pos += desc_size
+
+    if data_type not in PADDLE_DTYPES:
+        raise ValueError("unsupported data type %r in %s" % (data_type, filename))
+    dtype = np.dtype(PADDLE_DTYPES[data_type])
+    count = int(np.prod(dims)) if dims else 1
+    return np.frombuffer(data, dtype=dtype, count=count, offset=pos).reshape(dims)
+
+
+def _sigmoid(x):
+    """不会溢出的sigmoid"""
+    return 0.5 * (np.tanh(0.5 * x) + 1)
+
+
+class Batch(object):
+    """一个batch的序列按长度降序排列后的时间步索引
+
+    第t步只有长度大于t的序列参与计算，降序排列后它们恰好是前active[t]个序列
+
+    Attributes:
+        lengths: 降序排列的序列长度
+        starts: 降序排列的各序列在输入中的起始位置
+        active: 每一步参与计算的序列数
+    """
+
+    def __init__(self, lod):
+        offsets = np.asarray(lod, dtype=np.int64)
+        lengths = offsets[1:] - offsets[:-1]
+        order = np.argsort(-lengths, kind='mergesort')
+        self.lengths = lengths[order]
+        self.starts = offsets[:-1][order]
+        steps = int(self.lengths[0]) if len(self.lengths) else 0
+        self.active = (self.lengths[None, :] > np.arange(steps)[:, None]).sum(axis=1)
+
+    def positions(self, step, reverse=False):
+        """第step步各序列的输入位置，reverse为True时从序列末尾向前"""
+        count = self.active[step]
+        if reverse:
+            return self.starts[:count] + self.lengths[:count] - 1 - step
+        return self.starts[:count] + step
+
+
+class BiGRUCRF(object):
+    """nets.lex_net的NumPy实现
+
+    Attributes:
+        embedding: 词向量，[vocab_size, emb_dim]
+        layers: 每层BiGRU的(正向, 反向)参数，每个方向为(fc_w, gate_bias, w_ur, w_c)
+        emission: 输出层的(weight, bias)
+        start, end, transition: CRF的起始、结束及转移分数
+    """
+
+    def __init__(self, params):
+        self.embedding = params['word_emb'].astype(np.float32)
+
+        fc_names = self._numbered(params, 'fc')
+        gru_names = self._numbered(params, 'gru')
+        if not gru_names or len(gru_names) % 2 or len(fc_names) != len(gru_names) + 1:
+            raise ValueError("parameters do not match the BiGRU-CRF network")
+
+        # 每层依次为正向fc、正向gru、反向fc、反向gru，最后一个fc为输出层
+        directions = []
+        for fc_name, gru_name in zip(fc_names, gru_names):
+            weight = params[gru_name + '.w_0'].astype(np.float32)
+            size = weight.shape[0]
+            # gru权重前2D*D为更新门和重置门的权重，其后D*D为候选状态的权重
+            flat = weight.reshape(-1)
+            w_ur = flat[:2 * size * size].reshape(size, 2 * size)
+            w_c = flat[2 * size * size:].reshape(size, size)
+            # fc的bias与gru的bias都直接加在门的输入上
+            bias = (params[fc_name + '.b_0'].reshape(-1) +
+                    params[gru_name + '.b_0'].reshape(-1)).astype(np.float32)
+            directions.append((params[fc_name + '.w_0'].astype(np.float32), bias, w_ur, w_c))
+        self.layers = list(zip(directions[0::2], directions[1::2]))
+
+        self.emission = (params[fc_names[-1] + '.w_0'].astype(np.float32),
+                         params[fc_names[-1] + '.b_0'].reshape(-1).astype(np.float32))
+
+        crfw = params['crfw'].astype(np.float32)
+        self.start, self.end, self.transition = crfw[0], crfw[1], crfw[2:]
+
+    @staticmethod
+    def _numbered(params, prefix):
+        """按编号排序的某类层的参数名前缀，如fc_0, fc_1"""
+        pattern = re.compile(r'^(%s_(\d+))\.w_0$' % prefix)
+        matches = [pattern.match(name) for name in params]
+        return [match.group(1) for match in
+                sorted((m for m in matches if m), key=lambda m: int(m.group(2)))]
+
+    @classmethod
+    def load(cls, model_dir):
+        """装载save_inference_model保存的各参数文件"""
+        names = [name for name in os.listdir(model_dir) if not name.startswith('__')]
+        if 'word_emb' not in names:
+            raise ValueError("%s does not contain separately saved parameters, "
+                             "combined params files are not supported" % model_dir)
+        return cls(dict((name, load_lod_tensor(os.path.join(model_dir, name)))
+                        for name in names))
+
+    def _gru(self, gates, batch, w_ur, w_c, reverse):
+        """按时间步计算一个方向的GRU，同一步的所有序列一同计算
+        h = (1 - u) * h_prev + u * c，门的顺序为[u, r, c]
+        """
+        size = w_c.shape[0]
+        output = np.empty((len(gates), size), dtype=np.float32)
+        hidden = np.zeros((len(batch.lengths), size), dtype=np.float32)
+        for step in range(len(batch.active)):
+            positions = batch.positions(step, reverse)
+            prev = hidden[:len(positions)]
+            gate = gates[positions]
+
+            update_reset = _sigmoid(gate[:, :2 * size] + np.dot(prev, w_ur))
+            update, reset = update_reset[:, :size], update_reset[:, size:]
+            candidate = np.tanh(gate[:, 2 * size:] + np.dot(reset * prev, w_c))
+
+            prev += update * (candidate - prev)
+            output[positions] = prev
+        return output
+
+    def _viterbi(self, emission, batch):
+        """CRF维特比解码，返回每个位置的标签id"""
+        steps = len(batch.active)
+        if steps == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        score = emission[batch.positions(0)] + self.start
+        backpointers = [None]
+        for step in range(1, steps):
+            positions = batch.positions(step)
+            count = len(positions)
+            # [count, 上一步标签, 当前标签]
+            candidates = score[:count, :, None] + self.transition[None, :, :]
+            backpointers.append(candidates.argmax(axis=1))
+            score[:count] = candidates.max(axis=1) + emission[positions]
+
+        # 已结束的序列不再更新，score即为各序列最后一步的分数
+        current = (score + self.end).argmax(axis=1)
+        tags = np.empty(len(emission), dtype=np.int64)
+        for step in range(steps - 1, -1, -1):
+            count = batch.active[step]
+            tags[batch.positions(step)] = current[:count]
+            if step > 0:
+                current[:count] = backpointers[step][np.arange(count), current[:count]]
+        return tags
+
+    def predict(self, ids, lod):
+        """预测一个batch
+        Args:
+            ids: 一维int64数组，所有序列的词id
+            lod: 各序列在ids中的起始位置，最后一个元素为总长度
+        Returns:
+            与ids等长的标签id数组
+        """
+        batch = Batch(lod)
+        feature = self.embedding[ids]
+        for forward, backward in self.layers:
+            outputs = [self._gru(np.dot(feature, fc_w) + bias, batch, w_ur, w_c, reverse)
+                       for (fc_w, bias, w_ur, w_c), reverse in
+                       ((forward, False), (backward, True))]
+            feature = np.concatenate(outputs, axis=1)
+
+        weight, bias = self.emission
+        return self._viterbi(np.dot(feature, weight) + bias, batch)
+
+
+class NumpyPredictor(BufferedPredictor):
+    """与ZeroCopyPredictor接口一致的NumPy predictor
+
+    Attributes:
+        network: BiGRUCRF对象，只读，clone得到的predictor共享
+    """
+
+    def __init__(self, network):
+        super(NumpyPredictor, self).__init__(1)
+        self.network = network
+
+    def run(self, inputs):
+        """执行预测
+        Args:
+            inputs: list类型，只有一个(数组, lod)输入，lod为二层list
+        Returns:
+            list类型，只有一个(标签数组, lod)输出
+        """
+        data, lod = inputs[0]
+        tags = self.network.predict(np.asarray(data).reshape(-1), lod[0])
+        return [(tags.reshape(-1, 1), [list(lod[0])])]
+
+    def clone(self):
+        """复制predictor，共享模型参数，拥有独立的缓冲区"""
+        return NumpyPredictor(self.network)
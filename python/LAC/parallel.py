@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现多进程批量预测，用于大规模语料的离线处理。
+"""
+
+import multiprocessing
+from collections import deque
+
+from .reader import batch_iter
+
+# 每个工作进程持有的LAC对象，由_init_worker创建
+_worker_lac = None
+
+
+def _init_worker(model_path, mode, use_cuda, max_batch_tokens, custom, backend='paddle',
+                 fast_path=False):
+    """工作进程初始化，每个进程只装载一次模型"""
+    global _worker_lac
+    from .lac import LAC
+
+    _worker_lac = LAC(model_path, mode, use_cuda, max_batch_tokens, backend=backend,
+                      fast_path=fast_path)
+    _worker_lac.model.custom = custom
+
+
+def _run_chunk(texts):
+    """在工作进程中预测一个chunk"""
+    return _worker_lac.run(texts)
+
+
+def run_parallel(texts, model_path, mode, workers=None, chunk_size=1000,
+                 use_cuda=False, max_batch_tokens=None, custom=None, backend='paddle',
+                 fast_path=False):
+    """多进程执行模型预测
+    输入被惰性地切分为chunk分发给工作进程，同时处理中的chunk数不超过workers的两倍，
+    内存占用与输入总量无关
+    Args:
+        texts: 可迭代对象，每个元素为一个Unicode编码的字符串
+        model_path: 模型路径
+        mode: 模型类型，可选"lac"、"seg"和"rank"
+        workers: 工作进程数，为None时使用CPU核数
+        chunk_size: 每次分发给工作进程的文本数
+        use_cuda: 是否使用GPU预测
+        max_batch_tokens: 工作进程中子batch的token预算
+        custom: 用户词典，Customization对象
+        backend: 预测后端，"paddle"或"numpy"
+        fast_path: 工作进程是否跳过可由规则或用户词典确定的文本，与LAC的同名参数一致
+    Yields:
+        与输入顺序一致的单条预测结果
+    """
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (model_path, mode, use_cuda, max_batch_tokens, custom,
+                                 backend, fast_path))
+    pending = deque()
+    try:
+        for chunk in batch_iter(texts, chunk_size):
+            pending.append(pool.apply_async(_run_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                for result in pending.popleft().get():
+                    yield result
+
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
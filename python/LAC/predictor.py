@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现各预测后端共用的predictor基类。
+"""
+
+import numpy as np
+
+
+class BufferedPredictor(object):
+    """持有可复用输入缓冲区的predictor基类
+
+    模型将输入的id直接写入input_buffer返回的数组，再以run执行预测。
+    缓冲区属于predictor，clone得到的predictor拥有独立的缓冲区
+
+    Attributes:
+        buffers: 每个输入的int64缓冲区，按需扩容
+    """
+
+    def __init__(self, num_inputs):
+        self.buffers = [np.empty(0, dtype=np.int64) for _ in range(num_inputs)]
+
+    def input_buffer(self, index, size):
+        """返回第index个输入长度为size的缓冲区，容量不足时按两倍扩容"""
+        if len(self.buffers[index]) < size:
+            self.buffers[index] = np.empty(max(size, 2 * len(self.buffers[index])),
+                                           dtype=np.int64)
+        return self.buffers[index][:size]
+
+    def run(self, inputs):
+        raise NotImplementedError
+
+    def clone(self):
+        raise NotImplementedError
@@ -16,6 +16,184 @@
 # limitations under the License.
 #################################################################################
 
+import os
+import sys
+import mmap
+import array
+import struct
+from bisect import bisect_left
+from collections import deque
+
+
+ARRAY_FILE_VERSION = 1
+_HEADER = struct.Struct('=8sIII')
+_ENTRY = struct.Struct('=32s8sQQ')
+_BYTE_ORDER = 0x01020304
+
+
+def save_arrays(path, magic, arrays, version=ARRAY_FILE_VERSION):
+    """将多个array.array保存为可mmap装载的二进制文件
+    文件先写入临时文件再重命名，保证读取方不会看到写了一半的文件
+    Args:
+        path: 保存路径
+        magic: 8字节以内的bytes，标识文件内容的类型
+        arrays: list类型，每个元素为(名称, array.array)
+        version: 文件格式版本号
+    """
+    offset = _HEADER.size + _ENTRY.size * len(arrays)
+    entries = []
+    for name, data in arrays:
+        offset = (offset + 7) // 8 * 8
+        entries.append((name, data, offset))
+        offset += len(data) * data.itemsize
+
+    tmp_path = '%s.tmp.%d' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(magic, version, _BYTE_ORDER, len(arrays)))
+            for name, data, offset in entries:
+                f.write(_ENTRY.pack(name.encode('ascii'), data.typecode.encode('ascii'),
+                                    len(data), offset))
+            for name, data, offset in entries:
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data.tostring() if sys.version_info[0] == 2 else data.tobytes())
+        _replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _replace(src, dst):
+    """以src替换dst，Windows下os.rename不能覆盖已存在的文件，Python2没有os.replace"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def load_arrays(path, magic, version=ARRAY_FILE_VERSION):
+    """mmap装载save_arrays保存的文件
+    Python3下返回的数组为mmap上的memoryview，不发生拷贝，多进程间共享内存页
+    Args:
+        path: 文件路径
+        magic: 文件内容类型标识，需与保存时一致
+        version: 期望的文件格式版本号
+    Returns:
+        dict类型，名称到数组的映射
+    Raises:
+        ValueError: 文件类型、版本或字节序不匹配
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, file_version, byte_order, count = _HEADER.unpack_from(buf, 0)
+    if file_magic != magic.ljust(8, b'\0') or file_version != version \
+            or byte_order != _BYTE_ORDER:
+        raise ValueError("incompatible array file: %s" % path)
+
+    arrays = {}
+    view = memoryview(buf)
+    for i in range(count):
+        name, typecode, length, offset = _ENTRY.unpack_from(
+            buf, _HEADER.size + _ENTRY.size * i)
+        name = name.rstrip(b'\0').decode('ascii')
+        typecode = str(typecode.rstrip(b'\0').decode('ascii'))
+        nbytes = length * array.array(typecode).itemsize
+        if hasattr(view, 'cast'):
+            arrays[name] = view[offset:offset + nbytes].cast(typecode)
+        else:
+            # Python2的memoryview不支持cast，拷贝为array
+            data = array.array(typecode)
+            data.fromstring(buf[offset:offset + nbytes])
+            arrays[name] = data
+    return arrays
+
+
+class ArrayTrie(object):
+    """基于有序数组的紧凑Trie树
+    节点按广度优先顺序编号，根节点为0，每个节点的子节点编号连续且按字符码位(code point)
+    有序，因此节点state的子节点为[first[state], first[state + 1])，可以在label上二分查找。
+    所有数据保存在连续的数组中，可以保存到文件并通过mmap装载
+    Attributes:
+        first: 每个节点第一个子节点的编号，长度为节点数 + 1
+        label: 每个节点入边字符的码位
+        value: 每个节点对应单词的值，非单词的前缀节点为0
+    """
+
+    def __init__(self, first, label, value):
+        self.first = first
+        self.label = label
+        self.value = value
+
+    @classmethod
+    def build(cls, items):
+        """由(单词, 值)构建Trie树，值需为正整数"""
+        root = {}
+        for word, value in items:
+            node = root
+            for char in word:
+                node = node.setdefault(char, {})
+            # 以空字符串作为key保存单词的值
+            node[''] = value
+
+        first, label, value = [], [0], [0]
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            first.append(len(label))
+            for code, char in sorted((ord(char), char) for char in node if char):
+                label.append(code)
+                value.append(node[char].get('', 0))
+                queue.append(node[char])
+        first.append(len(label))
+
+        return cls(array.array('i', first), array.array('i', label),
+                   array.array('i', value))
+
+    def __len__(self):
+        """节点数"""
+        return len(self.label)
+
+    def to_arrays(self):
+        """返回用于save_arrays保存的数组列表"""
+        return [('first', self.first), ('label', self.label), ('value', self.value)]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由load_arrays装载的数组构建Trie树"""
+        return cls(arrays['first'], arrays['label'], arrays['value'])
+
+    def transition(self, state, code):
+        """从节点state经过码位为code的字符转移，不存在转移时返回-1"""
+        begin, end = self.first[state], self.first[state + 1]
+        child = bisect_left(self.label, code, begin, end)
+        if child < end and self.label[child] == code:
+            return child
+        return -1
+
+    def find(self, word):
+        """查询word对应的节点编号，word不是已有单词的前缀时返回-1"""
+        state = 0
+        for char in word:
+            state = self.transition(state, ord(char))
+            if state == -1:
+                break
+        return state
+
+    def get(self, word, default=None):
+        """查询单词的值，word不是单词时返回default"""
+        state = self.find(word)
+        if state == -1:
+            return default
+        return self.value[state] or default
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+
 class TriedTree(object):
     """实现Tried树的类
     Attributes:
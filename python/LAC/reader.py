@@ -22,9 +22,32 @@ The file_reader converts raw corpus to input.
 import io
 import logging
 import argparse
+import itertools
 import __future__
 
+import numpy as np
 
+try:
+    from . import registry
+except:
+    import registry
+
+# batches with fewer chars are encoded by dict lookups, where the fixed cost of
+# the NumPy calls outweighs the vectorized lookup
+VECTORIZE_MIN_CHARS = 64
+
+
+def load_kv_items(dict_path, delimiter="\t"):
+    """
+    Load (key, value) string pairs from file, skipping malformed lines
+    """
+    items = []
+    with io.open(dict_path, "r", encoding='utf8') as file:
+        for line in file:
+            terms = line.strip("\n").split(delimiter)
+            if len(terms) == 2:
+                items.append((terms[0], terms[1]))
+    return items
 
 def load_kv_dict(dict_path,
                  reverse=False, delimiter="\t", key_func=None, value_func=None):
@@ -50,21 +73,122 @@ def load_kv_dict(dict_path,
             result_dict[key] = value
     return result_dict
 
+def to_id_list(kv_dict):
+    """
+    Convert a {key: int id} dict into a list indexed by id
+    """
+    id_list = [None] * (max(kv_dict.values()) + 1)
+    for key, value in kv_dict.items():
+        id_list[value] = key
+    return id_list
+
+def batch_iter(iterable, batch_size):
+    """
+    Lazily split an iterable into lists of at most batch_size items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+class Vocab(object):
+    """
+    Word, label and replace tables loaded from the dict files of a model.
+    Vocabs are shared by all Datasets built from the same files through
+    registry.shared and must be treated as read-only
+    """
+
+    def __init__(self, word_dict_path, label_dict_path, word_rep_dict_path):
+        # read dict, each file is read once for both directions
+        word_items = load_kv_items(word_dict_path)
+        self.word2id_dict = dict((word, int(id)) for id, word in word_items)
+        self.id2word_dict = dict(word_items)
+        label_items = load_kv_items(label_dict_path)
+        self.label2id_dict = dict((label, int(id)) for id, label in label_items)
+        self.id2label_dict = dict(label_items)
+        self.word_replace_dict = load_kv_dict(word_rep_dict_path)
+        self.oov_id = self.word2id_dict['OOV']
+
+        # int id索引的词表和标签表，用于解码时避免str(id)及dict查找
+        self.id2word = to_id_list(self.word2id_dict)
+        self.id2label = to_id_list(self.label2id_dict)
+        self.init_label_table()
+        self.init_char_table()
+
+    @classmethod
+    def shared(cls, word_dict_path, label_dict_path, word_rep_dict_path):
+        """Get the process-wide Vocab of the dict files, loading it on first use"""
+        paths = [word_dict_path, label_dict_path, word_rep_dict_path]
+        return registry.shared('vocab', paths, lambda: cls(*paths))
+
+    def init_label_table(self):
+        """
+        Precompute per-label lookups indexed by label id:
+            label_tags: base tag of the label, e.g. "n" for "n-B"
+            label_tag_ids: index of the base tag in tag_names
+            label_begin: whether the label starts a word (B or S)
+        """
+        labels = [label if label is not None else '' for label in self.id2label]
+        tags = [label[:-2] for label in labels]
+
+        self.tag_names = sorted(set(tags))
+        tag2id = dict((tag, index) for index, tag in enumerate(self.tag_names))
+
+        self.label_tags = np.array(tags, dtype=object)
+        self.label_tag_ids = np.array([tag2id[tag] for tag in tags], dtype=np.int64)
+        self.label_begin = np.array([label.endswith("B") or label.endswith("S")
+                                     for label in labels], dtype=bool)
+        for table in (self.label_tags, self.label_tag_ids, self.label_begin):
+            table.flags.writeable = False
+
+    def init_char_table(self):
+        """
+        Precompute the id of every single char with the q2b replacement fused in:
+            char_table: dense int64 table indexed by BMP code point
+            char_table_extra: ids of the chars beyond the BMP found in the dicts,
+                              other chars beyond the BMP are OOV
+        """
+        def char_id(char):
+            return self.word2id_dict.get(self.word_replace_dict.get(char, char), self.oov_id)
+
+        self.char_table = np.full(0x10000, self.oov_id, dtype=np.int64)
+        self.char_table_extra = {}
+        for char in set(self.word2id_dict) | set(self.word_replace_dict):
+            if len(char) != 1:
+                continue
+            if ord(char) < 0x10000:
+                self.char_table[ord(char)] = char_id(char)
+            else:
+                self.char_table_extra[char] = char_id(char)
+        self.char_table.flags.writeable = False
+
+
 class Dataset(object):
     """data reader"""
 
     def __init__(self, args, dev_count=10):
-        # read dict
-        self.word2id_dict = load_kv_dict(
-            args.word_dict_path, reverse=True, value_func=int)
-        self.id2word_dict = load_kv_dict(args.word_dict_path)
-        self.label2id_dict = load_kv_dict(
-            args.label_dict_path, reverse=True, value_func=int)
-        self.id2label_dict = load_kv_dict(args.label_dict_path)
-        self.word_replace_dict = load_kv_dict(args.word_rep_dict_path)
-        self.oov_id = self.word2id_dict['OOV']
+        # read-only tables shared with other Datasets of the same dict files
+        self.vocab = Vocab.shared(
+            args.word_dict_path, args.label_dict_path, args.word_rep_dict_path)
+        self.word2id_dict = self.vocab.word2id_dict
+        self.id2word_dict = self.vocab.id2word_dict
+        self.label2id_dict = self.vocab.label2id_dict
+        self.id2label_dict = self.vocab.id2label_dict
+        self.word_replace_dict = self.vocab.word_replace_dict
+        self.oov_id = self.vocab.oov_id
         self.model = args.model
 
+        self.id2word = self.vocab.id2word
+        self.id2label = self.vocab.id2label
+        self.tag_names = self.vocab.tag_names
+        self.label_tags = self.vocab.label_tags
+        self.label_tag_ids = self.vocab.label_tag_ids
+        self.label_begin = self.vocab.label_begin
+        self.char_table = self.vocab.char_table
+        self.char_table_extra = self.vocab.char_table_extra
+
         self.args = args
         self.dev_count = dev_count
         self.segment_tool = None
@@ -110,6 +234,78 @@ class Dataset(object):
             word_ids.append(word_id)
         return word_ids
 
+    def encode_chars(self, text):
+        """
+        Convert every char of text to its id in one vectorized pass over the
+        UCS-4 code points, same as word_to_ids(text) but returns an int64 array.
+        Lone surrogates are passed through and map to the OOV id
+        """
+        codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        ids = self.char_table[codes & 0xFFFF]
+        for pos in np.flatnonzero(codes > 0xFFFF).tolist():
+            ids[pos] = self.char_table_extra.get(text[pos], self.oov_id)
+        return ids
+
+    def encode_texts(self, texts):
+        """
+        Char granularity ids of a batch, all texts are encoded in one pass
+        Returns:
+            int64 array of the ids of all texts, and the lod of each text
+        """
+        lod = [0]
+        for text in texts:
+            lod.append(lod[-1] + len(text))
+        text = "".join(texts)
+        if len(text) < VECTORIZE_MIN_CHARS:
+            return np.array(self.word_to_ids(text), dtype=np.int64), lod
+        return self.encode_chars(text), lod
+
+    def encode_segments(self, segments):
+        """
+        Vectorized text_to_ids over a batch of segmented texts, words in the vocab
+        are kept at word granularity and all other words are split into chars.
+        All texts are encoded in one pass and split by the returned lod
+        Returns:
+            int64 arrays of the ids and of the char length of each id, and the lod
+            of each text in them
+        """
+        words = [word for segment in segments for word in segment]
+        text = "".join(words)
+        if len(text) < VECTORIZE_MIN_CHARS:
+            return self._encode_segments_dict(segments)
+
+        ids = self.encode_chars(text)
+        word_length = np.ones(len(ids), dtype=np.int64)
+        keep = np.ones(len(ids), dtype=bool)
+
+        # 单字词的id与字粒度一致，只需替换词表中的多字词
+        word2id, replace = self.word2id_dict, self.word_replace_dict
+        pos = 0
+        char_lod = [0]
+        for segment in segments:
+            for word in segment:
+                if len(word) > 1 and word in word2id:
+                    ids[pos] = word2id.get(replace.get(word, word), self.oov_id)
+                    word_length[pos] = len(word)
+                    keep[pos + 1:pos + len(word)] = False
+                pos += len(word)
+            char_lod.append(pos)
+
+        # 每个文本之前保留的id数即为其在结果中的起始位置
+        kept = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept[1:])
+        return ids[keep], word_length[keep], kept[char_lod].tolist()
+
+    def _encode_segments_dict(self, segments):
+        """encode_segments by dict lookups, same as text_to_ids on each text"""
+        ids, word_length, lod = [], [], [0]
+        for segment in segments:
+            text_ids, text_length = self.text_to_ids(segment)
+            ids += text_ids
+            word_length += text_length
+            lod.append(len(ids))
+        return (np.array(ids, dtype=np.int64), np.array(word_length, dtype=np.int64), lod)
+
     def text_to_ids(self, text):
         """convert text to word index 
            lac/rank using mix char and word granularity
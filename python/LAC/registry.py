@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本模块实现进程内共享的只读资源注册表，同一文件装载出的词表、分词词典等只保留一份。
+"""
+
+import os
+import weakref
+import threading
+
+_lock = threading.Lock()
+# 只保存弱引用，最后一个使用者释放后对象随之回收，相当于引用计数
+_shared = weakref.WeakValueDictionary()
+
+
+def shared(kind, paths, factory):
+    """获取由一组文件装载的共享对象，不存在时调用factory创建
+    以文件的绝对路径和修改时间为key，文件更新后会装载新的对象，旧对象在不再被引用后回收。
+    共享对象被多个模型同时使用，调用方不能修改
+    Args:
+        kind: 对象类型名称，区分由相同文件装载的不同对象
+        paths: 装载对象所用的文件路径列表
+        factory: 无参数的函数，返回新装载的对象，对象需支持弱引用
+    Returns:
+        共享对象
+    """
+    key = (kind,) + tuple((os.path.abspath(path), os.path.getmtime(path))
+                          for path in paths)
+    with _lock:
+        obj = _shared.get(key)
+        if obj is None:
+            obj = factory()
+            _shared[key] = obj
+    return obj
+
+
+def live_objects():
+    """当前仍被引用的共享对象数，按类型统计"""
+    counts = {}
+    with _lock:
+        for key in list(_shared.keys()):
+            counts[key[0]] = counts.get(key[0], 0) + 1
+    return counts
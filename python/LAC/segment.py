@@ -19,30 +19,109 @@
 本文件定义了分词及其实现
 """
 import io
+import os
 import re
 import sys
+import array
+import hashlib
 import logging
 from math import log
+from bisect import bisect_left
 
-from .prefix_tree import TriedTree
+from .prefix_tree import ArrayTrie, save_arrays, load_arrays
 
 
 re_eng = re.compile('[a-zA-Z0-9]', re.U)
 
-def load_seg_dict(dict_path):
+SEG_DICT_MAGIC = b'LACSEG'
+SEG_DICT_VERSION = 3
+
+def build_seg_dict(dict_path):
     """
-    Load profile dict from file and calculate word frequency
+    Load profile dict from text file, build the prefix trie
+    and precompute the log-probability score of every word node
     """
-    result_dict = TriedTree()
+    words = []
     result_total = 0
 
     with io.open(dict_path, 'r', encoding='utf-8') as f:
         for line in f:
             word, count = line.strip().split(' ')
-            result_dict.add_word(word)
+            words.append((word, len(word)))
             result_total += int(count)
 
-    return result_dict.tree, log(result_total)
+    trie, logtotal = ArrayTrie.build(words), log(result_total)
+    score = array.array('d', [log(freq) - logtotal if freq else 0.0
+                              for freq in trie.value])
+    return trie, logtotal, score
+
+def _source_signature(dict_path):
+    """
+    Size and mtime of the text dict, stored in the compiled file to detect
+    a changed source even when its mtime moved backwards
+    """
+    stat = os.stat(dict_path)
+    return [float(stat.st_size), float(stat.st_mtime)]
+
+def seg_dict_cache_dir():
+    """
+    Directory of the compiled seg dicts: $LAC_CACHE_DIR if set, otherwise
+    lac under $XDG_CACHE_HOME (~/.cache by default), so that loading never
+    writes into the installed package
+    """
+    cache_dir = os.environ.get('LAC_CACHE_DIR')
+    if not cache_dir:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(cache_home, 'lac')
+    return cache_dir
+
+def default_compiled_path(dict_path):
+    """
+    Path of the compiled dict in the cache dir, named after the absolute
+    path of dict_path so that different dicts never share a compiled file
+    """
+    key = os.path.abspath(dict_path)
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8', 'surrogateescape')
+    digest = hashlib.md5(key).hexdigest()[:16]
+    return os.path.join(seg_dict_cache_dir(),
+                        '%s.%s.dat' % (os.path.basename(dict_path), digest))
+
+def load_seg_dict(dict_path, compiled_path=None):
+    """
+    Load profile dict as a compact prefix trie with word scores.
+    The trie is compiled to compiled_path (default_compiled_path(dict_path)
+    by default) on first load and memory-mapped from it afterwards, as long
+    as the size and mtime of dict_path match the ones recorded in the
+    compiled file
+    """
+    compiled_path = compiled_path or default_compiled_path(dict_path)
+    signature = _source_signature(dict_path)
+
+    if os.path.exists(compiled_path):
+        try:
+            arrays = load_arrays(compiled_path, SEG_DICT_MAGIC, SEG_DICT_VERSION)
+            if list(arrays['source']) == signature:
+                return ArrayTrie.from_arrays(arrays), arrays['logtotal'][0], arrays['score']
+            logging.info("Rebuild seg dict, %s is out of date" % compiled_path)
+        except Exception as e:
+            logging.warning("Rebuild seg dict, failed to load %s: %s" % (compiled_path, e))
+
+    trie, logtotal, score = build_seg_dict(dict_path)
+    try:
+        directory = os.path.dirname(compiled_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        save_arrays(compiled_path, SEG_DICT_MAGIC,
+                    trie.to_arrays() + [('score', score),
+                                        ('logtotal', array.array('d', [logtotal])),
+                                        ('source', array.array('d', signature))],
+                    SEG_DICT_VERSION)
+    except (IOError, OSError) as e:
+        logging.info("Seg dict is not compiled to %s: %s" % (compiled_path, e))
+
+    return trie, logtotal, score
 
 class Segment(object):
     def __init__(self, dict_path):
@@ -50,57 +129,65 @@ class Segment(object):
         """
         Args:
             self.dict_path: 字典地址
-            self.f_dict   : 前缀字典
+            self.f_dict   : 前缀字典，基于有序数组的Trie树
             self.logtotal : 词频总数取log
-            self.length   : 句子长度
-            self.dag      : DAG
+            self.score    : Trie树每个单词节点预先计算的log(词频) - logtotal
         """
 
         self.dict_path = dict_path
-        self.dag = {} 
-        self.length = 0
-
-        self.f_dict, self.logtotal = load_seg_dict(self.dict_path)
+        self.f_dict, self.logtotal, self.score = load_seg_dict(self.dict_path)
     
-    def fast_get_DAG(self, text):  
-        """生成DAG"""
-        self.length = len(text)
-        self.dag = {_:[_] for _ in range(self.length)}
-
-        for head_word in range(self.length):
-            end_word = head_word + 1
-            word = text[head_word:end_word]
-
-            while end_word <= self.length and word in self.f_dict:
-                if self.f_dict[word]:
-                    self.dag[head_word].append(end_word-1)
-                end_word += 1
-                word = text[head_word:end_word]
+    def fast_cut_batch(self, texts):
+        """批量分词
+        Args:
+            texts: 由string组成的list
+        Return:
+            由每个文本的分词结果组成的list
+        """
+        return [self.fast_cut(text) for text in texts]
     
     def fast_cut(self, text):
         """
-        分词
+        分词，从后向前在Trie树上walk的同时计算最大概率路径，不生成中间的DAG
         Args:
-            route   : 最大路径字典
-            buf     : 临时分词结果
+            route_score : 每个位置到句尾的最大路径得分
+            route_end   : 每个位置在最大路径上的词尾位置
+            buf         : 临时分词结果
         Return:
             segment : 分词结果
         """
-        self.fast_get_DAG(text)
-        route = dict()
+        first, label, value = self.f_dict.first, self.f_dict.label, self.f_dict.value
+        score = self.score
+        # 不在词典中的单字，按词频为1计算得分
+        single_score = log(1) - self.logtotal
+
+        codes = [ord(char) for char in text]
+        length = len(text)
+        route_score = [0.0] * (length + 1)
+        route_end = [0] * (length + 1)
 
-        route[self.length] = (0, 0)
-        
-        for idx in range(self.length-1, -1, -1):
+        for idx in range(length-1, -1, -1):
             # 取log防止向下溢出,取过log后除法变为减法
-            route[idx] = max((log(self.f_dict.get(text[idx: _+1]) or 1) -
-                            self.logtotal + route[_+1][0], _) for _ in self.dag[idx])
+            best_score, best_end = single_score + route_score[idx + 1], idx
+            state = 0
+            for end_word in range(idx, length):
+                begin, end = first[state], first[state + 1]
+                child = bisect_left(label, codes[end_word], begin, end)
+                if child == end or label[child] != codes[end_word]:
+                    break
+                state = child
+                if value[state]:
+                    # 得分相同时取更长的词
+                    current = score[state] + route_score[end_word + 1]
+                    if current >= best_score:
+                        best_score, best_end = current, end_word
+            route_score[idx], route_end[idx] = best_score, best_end
 
         incept_idx = 0
         buf = ""
         segment = []
-        while incept_idx < self.length:
-            end_idx = route[incept_idx][1] + 1
+        while incept_idx < length:
+            end_idx = route_end[incept_idx] + 1
             l_word = text[incept_idx:end_idx]
             
             if re_eng.match(l_word) and len(l_word) == 1:
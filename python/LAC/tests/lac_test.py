@@ -37,3 +37,27 @@ def rank():
     print(result)
 
 
+def clone():
+    # 多线程共享模型，每个线程使用clone得到的LAC对象，结果应与单线程预测一致
+    import threading
+    lac = LAC(model_path='models_general/lac_model', mode='lac')
+    text = u'百度是一家高科技公司'
+
+    # 单条输入返回[词语列表, 标签列表]，批量输入返回由其组成的list
+    expected = lac.run(text)
+    assert len(expected) == 2 and len(expected[0]) == len(expected[1])
+    assert u''.join(expected[0]) == text
+    assert lac.run([text, text]) == [expected, expected]
+
+    results = []
+
+    def worker(lac):
+        for _ in range(10):
+            results.append(lac.run(text))
+
+    threads = [threading.Thread(target=worker, args=(lac.clone(),)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [expected] * 40
@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本脚本生成NumPy预测后端的Paddle对照数据，生成的数据已随测试提交，只在需要更新时运行
+
+用Paddle的lookup_table、mul、gru、concat及crf_decoding算子搭建与nets.lex_net结构相同的
+小模型，参数随机生成，各参数按save_vars的格式分文件保存到paddle_fixture/model目录，
+并将Paddle对一组序列的预测结果保存为paddle_fixture/expected.json
+
+需要安装Paddle(仍保留上述算子的版本，如1.8或2.x)：
+    python make_paddle_fixture.py
+"""
+
+import json
+import os
+
+import numpy as np
+import paddle
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paddle_fixture')
+MODEL_DIR = os.path.join(FIXTURE_DIR, 'model')
+
+VOCAB_SIZE, EMB_DIM, HIDDEN, NUM_TAGS, LAYERS = 20, 8, 6, 5, 2
+SEQ_LENGTHS = [5, 1, 12, 3, 4, 12, 2, 8, 6, 1]
+
+
+def random_params(rng):
+    """按lex_net的参数名生成随机参数，返回[(名称, 数组)]"""
+    params = [('word_emb', rng.uniform(-2, 2, (VOCAB_SIZE, EMB_DIM)))]
+    size = EMB_DIM
+    for index in range(2 * LAYERS):
+        params.append(('fc_%d.w_0' % index, rng.uniform(-1, 1, (size, 3 * HIDDEN))))
+        params.append(('fc_%d.b_0' % index, rng.uniform(-0.2, 0.2, (3 * HIDDEN,))))
+        params.append(('gru_%d.w_0' % index, rng.uniform(-0.5, 0.5, (HIDDEN, 3 * HIDDEN))))
+        params.append(('gru_%d.b_0' % index, rng.uniform(-0.2, 0.2, (1, 3 * HIDDEN))))
+        if index % 2:
+            size = 2 * HIDDEN
+    params.append(('fc_%d.w_0' % (2 * LAYERS), rng.uniform(-3, 3, (size, NUM_TAGS))))
+    params.append(('fc_%d.b_0' % (2 * LAYERS), rng.uniform(-0.2, 0.2, (NUM_TAGS,))))
+    params.append(('crfw', rng.uniform(-1.5, 1.5, (NUM_TAGS + 2, NUM_TAGS))))
+    return [(name, value.astype(np.float32)) for name, value in params]
+
+
+def build_program(params):
+    """直接添加算子搭建网络，与fluid.layers的embedding、fc、dynamic_gru、crf_decoding一致"""
+    main = paddle.static.Program()
+    with paddle.static.program_guard(main, paddle.static.Program()):
+        block = main.global_block()
+        weights = dict((name, block.create_parameter(name=name, shape=list(value.shape),
+                                                     dtype='float32'))
+                       for name, value in params)
+
+        def var(dtype='float32'):
+            return block.create_var(dtype=dtype, lod_level=1)
+
+        def fc(x, index):
+            mul, out = var(), var()
+            block.append_op(type='mul', inputs={'X': x, 'Y': weights['fc_%d.w_0' % index]},
+                            outputs={'Out': mul}, attrs={'x_num_col_dims': 1, 'y_num_col_dims': 1})
+            block.append_op(type='elementwise_add',
+                            inputs={'X': mul, 'Y': weights['fc_%d.b_0' % index]},
+                            outputs={'Out': out}, attrs={'axis': 1})
+            return out
+
+        def gru(x, index, reverse):
+            hidden = var()
+            block.append_op(type='gru',
+                            inputs={'Input': x, 'Weight': weights['gru_%d.w_0' % index],
+                                    'Bias': weights['gru_%d.b_0' % index]},
+                            outputs={'Hidden': hidden, 'BatchGate': var(),
+                                     'BatchResetHiddenPrev': var(), 'BatchHidden': var()},
+                            attrs={'is_reverse': reverse, 'gate_activation': 'sigmoid',
+                                   'activation': 'tanh', 'origin_mode': False})
+            return hidden
+
+        word = paddle.static.data(name='word', shape=[-1, 1], dtype='int64', lod_level=1)
+        feature = var()
+        block.append_op(type='lookup_table', inputs={'Ids': word, 'W': weights['word_emb']},
+                        outputs={'Out': feature}, attrs={'padding_idx': -1})
+        for layer in range(LAYERS):
+            forward = gru(fc(feature, 2 * layer), 2 * layer, False)
+            backward = gru(fc(feature, 2 * layer + 1), 2 * layer + 1, True)
+            feature = var()
+            block.append_op(type='concat', inputs={'X': [forward, backward]},
+                            outputs={'Out': feature}, attrs={'axis': 1})
+
+        path = var('int64')
+        block.append_op(type='crf_decoding',
+                        inputs={'Emission': fc(feature, 2 * LAYERS),
+                                'Transition': weights['crfw']},
+                        outputs={'ViterbiPath': path})
+    return main, list(weights.values()), path
+
+
+def main():
+    paddle.enable_static()
+    rng = np.random.RandomState(0)
+    params = random_params(rng)
+    program, weights, path = build_program(params)
+
+    place = paddle.CPUPlace()
+    exe = paddle.static.Executor(place)
+    scope = paddle.static.global_scope()
+    for name, value in params:
+        scope.var(name).get_tensor().set(value, place)
+
+    seqs = [rng.randint(0, VOCAB_SIZE, size=length).tolist() for length in SEQ_LENGTHS]
+    word = paddle.base.core.LoDTensor()
+    word.set(np.array(sum(seqs, []), dtype=np.int64).reshape(-1, 1), place)
+    word.set_recursive_sequence_lengths([SEQ_LENGTHS])
+    tags, = exe.run(program, feed={'word': word}, fetch_list=[path], return_numpy=False)
+    tags = np.array(tags).reshape(-1).tolist()
+
+    if not os.path.isdir(MODEL_DIR):
+        os.makedirs(MODEL_DIR)
+    paddle.static.save_vars(exe, MODEL_DIR, program, vars=weights)
+    with open(os.path.join(MODEL_DIR, '__model__'), 'wb') as f:
+        f.write(program.desc.serialize_to_string())
+
+    expected, begin = [], 0
+    for seq in seqs:
+        expected.append([seq, tags[begin:begin + len(seq)]])
+        begin += len(seq)
+    with open(os.path.join(FIXTURE_DIR, 'expected.json'), 'w') as f:
+        f.write('{"paddle_version": %s, "sequences": [\n%s\n]}\n' % (
+            json.dumps(paddle.__version__), ',\n'.join(json.dumps(item) for item in expected)))
+
+
+if __name__ == '__main__':
+    main()
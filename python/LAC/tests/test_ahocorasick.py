@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本文件测试dict及数组实现的AC自动机与前缀树的匹配结果一致，不需要装载模型
+"""
+
+import random
+import unittest
+
+from LAC._compat import unichr
+from LAC.ahocorasick import ArrayAhocorasick, DictAhocorasick
+from LAC.prefix_tree import TriedTree
+
+
+def random_text(rnd, alphabet, max_length):
+    return u''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, max_length)))
+
+
+class AhocorasickTest(unittest.TestCase):
+
+    def check(self, words, texts):
+        tree = TriedTree()
+        for word in words:
+            tree.add_word(word)
+        automata = [ArrayAhocorasick.build(words), DictAhocorasick.build(words)]
+
+        for text in texts:
+            for automaton in automata:
+                self.assertEqual(automaton.search(text), tree.search(text), text)
+                self.assertEqual(automaton.search_all(text), tree.search_all(text), text)
+
+    def test_examples(self):
+        words = [u'春天', u'春天的', u'天的花', u'花开', u'开']
+        self.check(words, [u'', u'春', u'春天的花开了', u'春春天天的的花花开开'])
+        self.check([], [u'', u'春天'])
+
+    def test_random(self):
+        """小字母表使词之间大量重叠，覆盖失败指针的各种跳转"""
+        rnd = random.Random(0)
+        for _ in range(200):
+            alphabet = [unichr(0x4e00 + i) for i in range(rnd.randint(2, 6))]
+            words = set(random_text(rnd, alphabet, 5) for _ in range(rnd.randint(0, 30)))
+            words.discard(u'')
+            self.check(words, [random_text(rnd, alphabet, 30) for _ in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本文件测试长文档的切分与结果拼接，不需要装载模型
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from LAC.document import split_document, stitch
+
+
+def random_bounds(rnd, begin, end, max_word=3):
+    """在[begin, end)内随机切分，返回包含begin和end的词边界"""
+    bounds = [begin]
+    while bounds[-1] < end:
+        bounds.append(min(bounds[-1] + rnd.randint(1, max_word), end))
+    return bounds
+
+
+def window_result(bounds, begin, end):
+    """将文档的词边界截取到窗口[begin, end)内，作为窗口的预测结果
+    窗口边缘的词被截断，标签为词在文档中的序号
+    """
+    bounds = np.asarray(bounds)
+    index = np.arange(len(bounds) - 1)
+    keep = (bounds[1:] > begin) & (bounds[:-1] < end)
+    starts = np.maximum(bounds[:-1][keep], begin) - begin
+    ends = np.minimum(bounds[1:][keep], end) - begin
+    return [starts, ends, index[keep]]
+
+
+class SplitDocumentTest(unittest.TestCase):
+
+    def check_spans(self, text, spans, max_length):
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        for (begin, end), (next_begin, next_end) in zip(spans, spans[1:]):
+            self.assertTrue(begin < next_begin <= end < next_end)
+        for begin, end in spans:
+            self.assertTrue(0 < end - begin <= max_length)
+
+    def test_merge_sentences(self):
+        text = u'春天来了。花开了！' * 3
+        self.assertEqual(split_document(text, max_length=9, overlap=0), [(0, 9), (9, 18), (18, 27)])
+        self.assertEqual(split_document(text, max_length=20, overlap=0), [(0, 18), (18, 27)])
+        self.assertEqual(split_document(text), [(0, 27)])
+
+    def test_long_sentence(self):
+        text = u'春' * 100
+        for max_length, overlap in [(32, 8), (32, 20), (64, 40), (10, 0)]:
+            spans = split_document(text, max_length, overlap)
+            self.check_spans(text, spans, max_length)
+            for (begin, end), (next_begin, _) in zip(spans, spans[1:]):
+                self.assertEqual(end - next_begin, overlap)
+
+    def test_invalid_overlap(self):
+        for overlap in (-1, 32, 40):
+            self.assertRaises(ValueError, split_document, u'春天', 32, overlap)
+
+
+class StitchTest(unittest.TestCase):
+
+    def stitch_bounds(self, length, spans, results):
+        stitched = stitch(spans, results)
+        starts, ends = stitched[0], stitched[1]
+        self.assertEqual(starts[0], 0)
+        self.assertEqual(ends[-1], length)
+        self.assertTrue(np.all(starts[1:] == ends[:-1]))
+        self.assertTrue(np.all(ends > starts))
+        self.assertEqual(len(stitched[2]), len(starts))
+        return stitched
+
+    def test_consistent_windows(self):
+        """各窗口的预测一致时，拼接结果与整篇文档的结果相同"""
+        rnd = random.Random(0)
+        for max_length, overlap in [(32, 8), (32, 20), (64, 40)]:
+            length = 1000
+            bounds = random_bounds(rnd, 0, length)
+            spans = split_document(u'春' * length, max_length, overlap)
+            results = [window_result(bounds, begin, end) for begin, end in spans]
+
+            starts, ends, tags = self.stitch_bounds(length, spans, results)
+            self.assertEqual(starts.tolist(), bounds[:-1])
+            self.assertEqual(ends.tolist(), bounds[1:])
+            self.assertEqual(tags.tolist(), list(range(len(bounds) - 1)))
+
+    def test_inconsistent_windows(self):
+        """各窗口的预测不一致时，拼接结果仍然有序并覆盖整篇文档"""
+        rnd = random.Random(1)
+        for max_length, overlap in [(32, 8), (32, 20), (64, 40)]:
+            for _ in range(20):
+                length = 500
+                spans = split_document(u'春' * length, max_length, overlap)
+                results = [window_result(random_bounds(rnd, begin, end, 8), begin, end)
+                           for begin, end in spans]
+                self.stitch_bounds(length, spans, results)
+
+    def test_common_boundary(self):
+        """拼接位置为两个窗口共同的词边界时不截断词"""
+        spans = [(0, 10), (6, 16)]
+        left = window_result([0, 3, 7, 9, 10], 0, 10)
+        right = window_result([6, 9, 12, 16], 6, 16)
+        starts, ends, _ = stitch(spans, [left, right])
+        self.assertEqual(starts.tolist(), [0, 3, 7, 9, 12])
+        self.assertEqual(ends.tolist(), [3, 7, 9, 12, 16])
+
+    def test_no_common_boundary(self):
+        """没有共同词边界时在右窗口的词边界处拼接，只截断左窗口中跨过该位置的一个词"""
+        spans = [(0, 10), (6, 16)]
+        left = window_result([0, 3, 7, 10], 0, 10)
+        right = window_result([6, 8, 12, 16], 6, 16)
+        starts, ends, tags = stitch(spans, [left, right])
+        self.assertEqual(starts.tolist(), [0, 3, 7, 8, 12])
+        self.assertEqual(ends.tolist(), [3, 7, 8, 12, 16])
+        self.assertEqual(tags.tolist(), [0, 1, 2, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+################################################################################
+#
+#   Copyright (c) 2020  Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#################################################################################
+
+"""
+本文件测试NumPy预测后端，使用随机参数及随测试提交的Paddle对照数据，不需要装载模型和Paddle
+"""
+
+import itertools
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from LAC.numpy_backend import BiGRUCRF, NumpyPredictor, load_lod_tensor
+
+# make_paddle_fixture.py生成的Paddle模型及Paddle的预测结果
+PADDLE_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paddle_fixture')
+
+
+def varint(value):
+    """protobuf的varint编码"""
+    out = bytearray()
+    while True:
+        byte, value = value & 0x7f, value >> 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def save_lod_tensor(filename, array, packed=False):
+    """按Paddle的格式保存float32参数，带一层lod，dims可以使用packed编码"""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    desc = b'\x08' + varint(5)
+    if packed:
+        dims = b''.join(varint(dim) for dim in array.shape)
+        desc += b'\x12' + varint(len(dims)) + dims
+    else:
+        desc += b''.join(b'\x10' + varint(dim) for dim in array.shape)
+
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<IQQQQ', 0, 1, 16, 0, 3))
+        f.write(struct.pack('<Ii', 0, len(desc)) + desc + array.tobytes())
+
+
+def make_params(rng, vocab_size, emb_dim, hidden, num_tags, layers=2):
+    """按nets.lex_net的结构生成随机参数，层编号从非零开始"""
+    params = {'word_emb': rng.randn(vocab_size, emb_dim),
+              'crfw': rng.randn(num_tags + 2, num_tags)}
+    size = emb_dim
+    for index in range(3, 3 + 2 * layers):
+        params['fc_%d.w_0' % index] = rng.randn(size, 3 * hidden) * 0.3
+        params['fc_%d.b_0' % index] = rng.randn(3 * hidden) * 0.1
+        params['gru_%d.w_0' % index] = rng.randn(hidden, 3 * hidden) * 0.3
+        params['gru_%d.b_0' % index] = rng.randn(1, 3 * hidden) * 0.1
+        if index % 2 == 0:
+            size = 2 * hidden
+    output = 3 + 2 * layers
+    params['fc_%d.w_0' % output] = rng.randn(size, num_tags)
+    params['fc_%d.b_0' % output] = rng.randn(num_tags)
+    return dict((name, value.astype(np.float32)) for name, value in params.items())
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def reference_gru(x, fc_w, fc_b, gru_w, gru_b, reverse):
+    """逐个时间步计算单条序列的GRU"""
+    size = gru_w.shape[0]
+    gates = np.dot(x, fc_w) + fc_b + gru_b.reshape(-1)
+    flat = gru_w.reshape(-1)
+    w_ur = flat[:2 * size * size].reshape(size, 2 * size)
+    w_c = flat[2 * size * size:].reshape(size, size)
+
+    hidden = np.zeros(size, dtype=np.float32)
+    output = np.zeros((len(x), size), dtype=np.float32)
+    steps = range(len(x) - 1, -1, -1) if reverse else range(len(x))
+    for step in steps:
+        update_reset = sigmoid(gates[step, :2 * size] + np.dot(hidden, w_ur))
+        update, reset = update_reset[:size], update_reset[size:]
+        candidate = np.tanh(gates[step, 2 * size:] + np.dot(reset * hidden, w_c))
+        hidden = (1 - update) * hidden + update * candidate
+        output[step] = hidden
+    return output
+
+
+def reference_tags(params, ids, layers=2):
+    """单条序列的预测，CRF解码穷举所有标签序列"""
+    feature = params['word_emb'][ids]
+    for index in range(3, 3 + 2 * layers, 2):
+        outputs = [reference_gru(feature, params['fc_%d.w_0' % i], params['fc_%d.b_0' % i],
+                                 params['gru_%d.w_0' % i], params['gru_%d.b_0' % i], reverse)
+                   for i, reverse in ((index, False), (index + 1, True))]
+        feature = np.concatenate(outputs, axis=1)
+
+    output = 3 + 2 * layers
+    emission = np.dot(feature, params['fc_%d.w_0' % output]) + params['fc_%d.b_0' % output]
+    crfw = params['crfw']
+
+    def score(path):
+        total = crfw[0, path[0]] + crfw[1, path[-1]]
+        total += sum(emission[step, tag] for step, tag in enumerate(path))
+        total += sum(crfw[2 + prev, tag] for prev, tag in zip(path, path[1:]))
+        return total
+
+    return list(max(itertools.product(range(emission.shape[1]), repeat=len(ids)), key=score))
+
+
+class NumpyBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.params = make_params(self.rng, vocab_size=50, emb_dim=8, hidden=6, num_tags=4)
+        self.model_dir = tempfile.mkdtemp()
+        for i, (name, value) in enumerate(sorted(self.params.items())):
+            save_lod_tensor(os.path.join(self.model_dir, name), value, packed=i % 2)
+        with open(os.path.join(self.model_dir, '__model__'), 'wb') as f:
+            f.write(b'program')
+
+    def tearDown(self):
+        shutil.rmtree(self.model_dir)
+
+    def test_load_lod_tensor(self):
+        for name, value in self.params.items():
+            loaded = load_lod_tensor(os.path.join(self.model_dir, name))
+            self.assertEqual(loaded.dtype, np.float32)
+            self.assertTrue(np.array_equal(loaded, value), name)
+
+    def test_predict(self):
+        """按长度降序批量计算的结果与逐条计算、穷举解码的结果一致"""
+        network = BiGRUCRF.load(self.model_dir)
+        seqs = [self.rng.randint(0, 50, size=length).tolist() for length in [3, 1, 5, 2, 5, 4]]
+        lod = [0]
+        for seq in seqs:
+            lod.append(lod[-1] + len(seq))
+        ids = np.array(sum(seqs, []), dtype=np.int64)
+
+        tags = network.predict(ids, lod)
+        for i, seq in enumerate(seqs):
+            self.assertEqual(tags[lod[i]:lod[i + 1]].tolist(),
+                             reference_tags(self.params, seq), i)
+
+        predictor = NumpyPredictor(network).clone()
+        self.assertIs(predictor.network, network)
+        (output, output_lod), = predictor.run([(ids.reshape(-1, 1), [lod])])
+        self.assertEqual(output.reshape(-1).tolist(), tags.tolist())
+        self.assertEqual(output_lod, [lod])
+
+    def test_paddle_parity(self):
+        """与Paddle算子的预测结果一致，不依赖本文件对GRU及CRF的参考实现"""
+        with open(os.path.join(PADDLE_FIXTURE, 'expected.json')) as f:
+            sequences = json.load(f)['sequences']
+        lod = [0]
+        for seq, _ in sequences:
+            lod.append(lod[-1] + len(seq))
+        ids = np.array(sum((seq for seq, _ in sequences), []), dtype=np.int64)
+
+        tags = BiGRUCRF.load(os.path.join(PADDLE_FIXTURE, 'model')).predict(ids, lod)
+        for i, (_, expected) in enumerate(sequences):
+            self.assertEqual(tags[lod[i]:lod[i + 1]].tolist(), expected, i)
+
+    def test_combined_params(self):
+        os.remove(os.path.join(self.model_dir, 'word_emb'))
+        self.assertRaises(ValueError, BiGRUCRF.load, self.model_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,13 +18,13 @@
 
 """
 本模块定义了LAC中使用到的工具类函数
+paddle只在需要时才被import，以缩短import LAC的时间
 """
 
 from __future__ import print_function
 import os
 import sys
 import numpy as np
-import paddle.fluid as fluid
 
 try:
     import configparser
@@ -43,8 +43,12 @@ def check_cuda(use_cuda):
            "because you are using paddlepaddle-cpu.\n"
            "Please: 1. Install paddlepaddle-gpu to run your models on GPU"
            "or 2. Set use_cuda = False to run models on CPU.\n")
+    if use_cuda != True:
+        return
+
     try:
-        if use_cuda == True and fluid.is_compiled_with_cuda() == False:
+        import paddle.fluid as fluid
+        if fluid.is_compiled_with_cuda() == False:
             print(err)
             sys.exit(1)
     except Exception as e:
@@ -119,6 +123,8 @@ def to_str(string, encoding="utf-8"):
 
 def to_lodtensor(data, place):
     """Convert data in list into lodtensor."""
+    import paddle.fluid as fluid
+
     seq_lens = [len(seq) for seq in data]
     cur_len = 0
     lod = [cur_len]
@@ -135,6 +141,8 @@ def to_lodtensor(data, place):
 
 def init_checkpoint(exe, init_checkpoint_path, main_program):
     """Init CheckPoint"""
+    import paddle.fluid as fluid
+
     assert os.path.exists(
         init_checkpoint_path), "[%s] cann't be found." % init_checkpoint_path
 
@@ -156,6 +164,8 @@ def init_pretraining_params(exe,
                             pretraining_params_path,
                             main_program):
     """load params of pretrained model, NOT including moment, learning_rate"""
+    import paddle.fluid as fluid
+
     assert os.path.exists(pretraining_params_path
                           ), "[%s] cann't be found." % pretraining_params_path
 
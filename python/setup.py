@@ -20,7 +20,9 @@
 Setup script.
 """
 
+import sys
 from setuptools import setup
+from setuptools.command.build_py import build_py
 import pkg_resources
 from io import open
 
@@ -45,6 +47,22 @@ try:
 except ImportError:
     install_requires = ['paddlepaddle>=1.6']
 
+# numpy后端及数据处理依赖numpy
+install_requires.append('numpy')
+
+# LAC.aio使用async语法，Python2不能编译，不打包进Python2的安装包
+PY2_EXCLUDED_MODULES = ['aio']
+
+
+class BuildPy(build_py):
+    """Python2下构建时跳过只支持Python3的模块"""
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] == 2:
+            modules = [m for m in modules if m[1] not in PY2_EXCLUDED_MODULES]
+        return modules
+
 
 with open("README.md", "r", encoding='utf8') as fh:
     long_description = fh.read()
@@ -62,6 +80,12 @@ setup(
     packages=['LAC'],
     package_dir={'LAC': 'LAC'},
     package_data={'LAC': ['*.py', 'lac_model/*/*', 'seg_model/*/*', 'rank_model/*/*']},
+    # 分词词典的编译缓存不打包，由运行时生成在用户缓存目录下
+    exclude_package_data={'LAC': ['%s/*/*.dat' % model for model in
+                                  ('lac_model', 'seg_model', 'rank_model')] +
+                          (['%s.py' % m for m in PY2_EXCLUDED_MODULES]
+                           if sys.version_info[0] == 2 else [])},
+    cmdclass={'build_py': BuildPy},
     platforms="any",
     license='Apache 2.0',
     keywords=('lac chinese lexical analysis'),